@@ -0,0 +1,153 @@
+"""Vérifie que draw_winning_number suit la même loi que la boucle de relances de end_game.
+
+Pour plusieurs ensembles de numéros choisis, on tire autant de parties avec la boucle
+d'origine (dé relancé jusqu'à tomber sur un numéro choisi) qu'avec draw_winning_number,
+puis on compare par un test du khi-deux d'homogénéité :
+le numéro gagnant, le nombre de lancers ratés affichés (borné par RELANCES_ANIMEES_MAX)
+et les numéros de ces lancers ratés.
+Un tirage volontairement biaisé sert de témoin : le test doit le rejeter, sinon il manque de puissance.
+Le script se termine en erreur si une loi diffère ou si le témoin passe.
+
+    python bench/check_draw.py [--trials 100000] [--alpha 0.001] [--seed 0]
+"""
+import argparse
+import math
+import os
+import random
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from games import draw_winning_number  # noqa: E402
+
+RELANCES_ANIMEES_MAX = 2
+CHOSEN_SETS = [
+    [4],
+    [2, 5],
+    [1, 2, 6],
+    [1, 3, 4, 6],
+    [1, 2, 3, 4, 5],
+    [1, 2, 3, 4, 5, 6],
+    # Historique antérieur aux numéros distincts : deux joueurs sur le même numéro
+    [3, 3, 5],
+]
+
+
+def reroll_loop(chosen_numbers, max_missed, rng):
+    """Boucle de relances de end_game (MODE_TIRAGE = "relance"), ratés affichés bornés comme en mode direct."""
+    chosen = set(chosen_numbers)
+    missed = []
+    while True:
+        number = rng.randint(1, 6)
+        if number in chosen:
+            return number, missed[:max_missed]
+        missed.append(number)
+
+
+def biased_draw(chosen_numbers, max_missed, rng):
+    """Témoin : le plus petit numéro choisi sort un peu plus souvent que les autres."""
+    number, missed = draw_winning_number(chosen_numbers, max_missed, rng)
+    chosen = sorted(set(chosen_numbers))
+    if len(chosen) > 1 and rng.random() < 0.02:
+        number = chosen[0]
+    return number, missed
+
+
+def chi2_sf(statistic, df):
+    """P(X >= statistic) pour une loi du khi-deux à `df` degrés de liberté (fonction gamma incomplète régularisée)."""
+    if statistic <= 0:
+        return 1.0
+    a, x = df / 2, statistic / 2
+    log_prefix = a * math.log(x) - x - math.lgamma(a)
+    if x < a + 1:
+        # Série de la fonction gamma incomplète inférieure
+        term = total = 1 / a
+        n = a
+        while abs(term) > abs(total) * 1e-15:
+            n += 1
+            term *= x / n
+            total += term
+        return max(0.0, 1 - math.exp(log_prefix) * total)
+    # Fraction continue de la fonction gamma incomplète supérieure (méthode de Lentz)
+    tiny = 1e-300
+    b = x + 1 - a
+    c = 1 / tiny
+    d = 1 / b
+    h = d
+    for i in range(1, 1000):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = tiny if abs(d) < tiny else d
+        c = b + an / c
+        c = tiny if abs(c) < tiny else c
+        d = 1 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < 1e-15:
+            break
+    return math.exp(log_prefix) * h
+
+
+def homogeneity(observed, reference):
+    """Test du khi-deux d'homogénéité de deux échantillons de catégories. Retourne (statistique, ddl, p)."""
+    categories = sorted(observed.keys() | reference.keys())
+    total_observed, total_reference = sum(observed.values()), sum(reference.values())
+    total = total_observed + total_reference
+    statistic = 0.0
+    for category in categories:
+        row = observed[category] + reference[category]
+        for count, column in ((observed[category], total_observed), (reference[category], total_reference)):
+            expected = row * column / total
+            statistic += (count - expected) ** 2 / expected
+    df = len(categories) - 1
+    return statistic, df, chi2_sf(statistic, df) if df > 0 else 1.0
+
+
+def sample(draw, chosen, trials, max_missed, rng):
+    winners, miss_counts, miss_numbers = Counter(), Counter(), Counter()
+    for _ in range(trials):
+        number, missed = draw(chosen, max_missed, rng)
+        winners[number] += 1
+        miss_counts[len(missed)] += 1
+        miss_numbers.update(missed)
+    return winners, miss_counts, miss_numbers
+
+
+def compare(draw, chosen, args, seed):
+    reference = sample(reroll_loop, chosen, args.trials, args.max_missed, random.Random(seed))
+    observed = sample(draw, chosen, args.trials, args.max_missed, random.Random(seed + 1))
+    return [homogeneity(o, r) for o, r in zip(observed, reference)]
+
+
+def main(args):
+    failures = 0
+    trials = f"{args.trials:,}".replace(",", " ")
+    print(f"{trials} tirages par loi, seuil {args.alpha:g}, ratés affichés au plus {args.max_missed}")
+    print(f"{'numéros choisis':<22}{'gagnant (p)':>14}{'nb ratés (p)':>14}{'n° ratés (p)':>14}")
+    for index, chosen in enumerate(CHOSEN_SETS):
+        results = compare(draw_winning_number, chosen, args, args.seed + 2 * index)
+        cells = "".join(f"{p:>14.4f}" if df > 0 else f"{'—':>14}" for _, df, p in results)
+        rejected = any(df > 0 and p < args.alpha for _, df, p in results)
+        failures += rejected
+        print(f"{str(chosen):<22}{cells}{'  ÉCART' if rejected else ''}")
+
+    # Témoin : un biais de 2 % sur le gagnant doit être détecté
+    _, _, control_p = compare(biased_draw, [1, 3, 4, 6], args, args.seed + 100)[0]
+    print(f"\nTémoin biaisé, gagnant : p = {control_p:.2e}")
+
+    if failures:
+        raise SystemExit(f"❌ draw_winning_number diffère de la boucle de relances pour {failures} ensemble(s) de numéros.")
+    if control_p >= args.alpha:
+        raise SystemExit("❌ Le témoin biaisé n'est pas détecté : augmenter --trials.")
+    print("✅ Mêmes lois pour le gagnant, le nombre de ratés affichés et leurs numéros.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trials", type=int, default=100_000, help="tirages par loi et par ensemble de numéros")
+    parser.add_argument("--alpha", type=float, default=0.001, help="seuil de rejet de chaque test")
+    parser.add_argument("--max-missed", type=int, default=RELANCES_ANIMEES_MAX, help="lancers ratés affichés au plus")
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
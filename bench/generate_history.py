@@ -0,0 +1,135 @@
+"""Génère un historique de parties synthétique dans une base de statistiques.
+
+Les parties sont tirées par blocs avec NumPy (nombre de joueurs, mises, numéros,
+gagnant, égalités) puis chargées par executemany dans `rounds` et `participants`,
+avec les mêmes règles que le bot : commission de 5 %, pot net partagé entre les gagnants.
+Les cumuls `player_stats` et `player_daily_stats` sont ensuite reconstruits.
+Les joueurs suivent une loi de Zipf : quelques habitués jouent la plupart des parties.
+
+Nécessite NumPy, en plus des dépendances du bot : pip install -r bench/requirements.txt
+
+    python bench/generate_history.py game_stats.db --games 1000000 [--players 2 6] [--stakes 1000,10000,100000] [--tie-rate 0.01]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+
+COMMISSION = 0.05
+CHUNK = 100_000
+# Serveur auquel l'historique généré est rattaché
+GUILD_ID = 1
+
+
+def player_weights(pool, exponent=1.1):
+    weights = 1.0 / np.arange(1, pool + 1) ** exponent
+    return weights / weights.sum()
+
+
+def draw_chunk(rng, n, first_id, min_players, max_players, stakes, tie_rate, weights, start, span):
+    """Tire `n` parties ; retourne les colonnes de `rounds` et de `participants`."""
+    pool = len(weights)
+    k = rng.integers(min_players, max_players + 1, size=n)
+    slots = np.arange(max_players)
+    mask = slots < k[:, None]
+
+    # Joueurs distincts dans une partie : un premier joueur tiré selon sa popularité,
+    # les suivants décalés d'un pas positif cumulé qui reste inférieur à la taille du groupe
+    steps = rng.integers(1, max(pool // max_players, 2), size=(n, max_players))
+    steps[:, 0] = 0
+    players = (rng.choice(pool, size=n, p=weights)[:, None] + np.cumsum(steps, axis=1)) % pool + 1
+
+    # Numéros distincts de 1 à 6 : une permutation aléatoire par partie
+    numbers = np.argsort(rng.random((n, 6)), axis=1)[:, :max_players] + 1
+    winner = (rng.random(n) * k).astype(np.int64)
+    rows = np.arange(n)
+    numero_resultat = numbers[rows, winner]
+
+    # Égalité (données héritées de l'ancien schéma) : un second joueur a le même numéro que le gagnant
+    tie = (rng.random(n) < tie_rate) & (k >= 2)
+    other = (winner + 1 + (rng.random(n) * (k - 1)).astype(np.int64)) % k
+    numbers[rows[tie], other[tie]] = numero_resultat[tie]
+    is_winner = numbers == numero_resultat[:, None]
+    nb_gagnants = np.where(tie, 2, 1)
+
+    montant = np.asarray(stakes)[rng.integers(0, len(stakes), size=n)]
+    pot = montant * k
+    commission = (pot * COMMISSION).astype(np.int64)
+    gain = (pot - commission) // nb_gagnants
+
+    seconds = np.sort(rng.integers(0, span, size=n))
+    dates = np.char.replace(np.datetime_as_string(start + seconds.astype("timedelta64[s]"), unit="s"), "T", " ")
+    game_ids = np.arange(first_id, first_id + n)
+
+    guild_ids = [GUILD_ID] * n
+    rounds = zip(game_ids.tolist(), guild_ids, montant.tolist(), pot.tolist(), commission.tolist(), numero_resultat.tolist(), nb_gagnants.tolist(), dates.tolist())
+    flat = mask.ravel()
+    participants = zip(
+        np.repeat(game_ids, max_players)[flat].tolist(),
+        [GUILD_ID] * int(flat.sum()),
+        players.ravel()[flat].tolist(),
+        numbers.ravel()[flat].tolist(),
+        np.repeat(montant, max_players)[flat].tolist(),
+        is_winner.ravel()[flat].astype(np.int64).tolist(),
+        (is_winner * gain[:, None]).ravel()[flat].tolist(),
+    )
+    return rounds, participants
+
+
+def generate(path, games, min_players=2, max_players=6, stakes=(1000, 5000, 10000, 50000, 100000),
+             tie_rate=0.0, pool=5000, days=365, seed=0, quiet=False):
+    """Ajoute `games` parties à la base `path` (créée et migrée si besoin), puis reconstruit les cumuls."""
+    if not 1 <= min_players <= max_players <= 6:
+        raise ValueError("Le nombre de joueurs doit être compris entre 1 et 6.")
+    Database(path).close()
+
+    rng = np.random.default_rng(seed)
+    weights = player_weights(pool)
+    end = np.datetime64("now", "s")
+    start = end - np.timedelta64(days, "D")
+    span = days * 86400
+
+    conn = sqlite3.connect(path)
+    # Chargement en masse : la base est jetable, on ne paie pas la durabilité
+    conn.execute("PRAGMA synchronous=OFF")
+    first_id = (conn.execute("SELECT MAX(game_id) FROM rounds").fetchone()[0] or 0) + 1
+    t0 = time.perf_counter()
+    for offset in range(0, games, CHUNK):
+        n = min(CHUNK, games - offset)
+        rounds, participants = draw_chunk(rng, n, first_id + offset, min_players, max_players, stakes, tie_rate, weights, start, span)
+        conn.executemany("INSERT INTO rounds (game_id, guild_id, montant, pot, commission, numero_resultat, nb_gagnants, date) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rounds)
+        conn.executemany("INSERT INTO participants (game_id, guild_id, joueur_id, numero_choisi, montant, is_winner, gain) VALUES (?, ?, ?, ?, ?, ?, ?)", participants)
+        conn.commit()
+        if not quiet:
+            print(f"  {offset + n:>12,} parties insérées ({time.perf_counter() - t0:.1f} s)")
+    conn.close()
+
+    # Les cumuls sont recalculés par le code du bot lui-même
+    db = Database(path)
+    count = db._writer.submit(db._rebuild_stats).result()
+    db.close()
+    if not quiet:
+        print(f"Cumuls reconstruits pour {count:,} joueurs ({time.perf_counter() - t0:.1f} s au total)")
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="base SQLite à remplir (créée si elle n'existe pas)")
+    parser.add_argument("--games", type=int, default=100_000, help="nombre de parties à générer")
+    parser.add_argument("--players", type=int, nargs=2, default=(2, 6), metavar=("MIN", "MAX"), help="joueurs par partie")
+    parser.add_argument("--stakes", default="1000,5000,10000,50000,100000", help="mises possibles, séparées par des virgules")
+    parser.add_argument("--tie-rate", type=float, default=0.0, help="proportion de parties à deux gagnants")
+    parser.add_argument("--pool", type=int, default=5000, help="nombre de joueurs distincts")
+    parser.add_argument("--days", type=int, default=365, help="durée couverte par l'historique, en jours")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate(args.path, args.games, *args.players, [int(s) for s in args.stakes.split(",")],
+             args.tie_rate, args.pool, args.days, args.seed)
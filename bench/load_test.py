@@ -0,0 +1,255 @@
+"""Test de charge hors ligne du cycle de vie des parties.
+
+Remplace les interactions, messages et salons Discord par des faux objets en mémoire,
+puis fait jouer de nombreux lobbies simultanés sur une seule boucle asyncio :
+/duel, choix des numéros (dont des clics concurrents sur le même numéro), croupier,
+lancement et tirage. Les pauses du jeu sont supprimées et la base est un fichier
+temporaire. Affiche le débit, les latences p50/p99 des callbacks et les appels REST émis.
+
+    python bench/load_test.py [--lobbies 50] [--guilds 1] [--rounds 20] [--players 4] [--rest-latency 0]
+"""
+import argparse
+import asyncio
+import collections
+import itertools
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GAME_STATS_DB", os.path.join(tempfile.mkdtemp(), "game_stats.db"))
+
+import discord  # noqa: E402
+import main  # noqa: E402
+
+real_sleep = asyncio.sleep
+rest_calls = collections.Counter()
+rest_latency = 0.0
+message_ids = itertools.count(10_000_000)
+
+
+async def fast_sleep(delay, result=None):
+    # Les temps de suspense du jeu sont supprimés, mais on rend quand même la main
+    await real_sleep(0)
+    return result
+
+
+async def rest(name):
+    rest_calls[name] += 1
+    if rest_latency:
+        await real_sleep(rest_latency)
+
+
+# --- FAUX OBJETS DISCORD ---
+class FakeRole:
+    def __init__(self, role_id):
+        self.id = role_id
+        self.mention = f"<@&{role_id}>"
+
+
+class FakeGuild:
+    def __init__(self, guild_id=1):
+        self.id = guild_id
+        self.name = f"serveur {guild_id}"
+        self.roles = {main.ID_CROUPIER: FakeRole(main.ID_CROUPIER), main.ID_MEMBRE: FakeRole(main.ID_MEMBRE)}
+
+    def get_role(self, role_id):
+        return self.roles.get(role_id)
+
+
+class FakeUser:
+    def __init__(self, user_id, roles=()):
+        self.id = user_id
+        self.display_name = f"joueur {user_id}"
+        self.mention = f"<@{user_id}>"
+        self.roles = list(roles)
+        self.avatar = None
+
+    def get_role(self, role_id):
+        return next((role for role in self.roles if role.id == role_id), None)
+
+
+class FakeMessage:
+    def __init__(self, channel, content=None, embed=None, view=None):
+        self.id = next(message_ids)
+        self.channel = channel
+        self.content = content
+        self.embeds = [embed] if embed else []
+        self.view = view
+
+    def apply(self, **kwargs):
+        if "embed" in kwargs:
+            self.embeds = [kwargs["embed"]] if kwargs["embed"] else []
+        if "view" in kwargs:
+            self.view = kwargs["view"]
+        if "content" in kwargs:
+            self.content = kwargs["content"]
+
+    async def edit(self, **kwargs):
+        await rest("message.edit")
+        self.apply(**kwargs)
+
+    async def delete(self):
+        await rest("message.delete")
+        self.channel.messages.pop(self.id, None)
+
+
+class FakeChannel:
+    def __init__(self, guild):
+        self.id = main.ID_SALON_JEU + guild.id
+        self.guild = guild
+        self.messages = {}
+
+    async def send(self, content=None, embed=None, view=None, **kwargs):
+        await rest("channel.send")
+        message = FakeMessage(self, content, embed, view)
+        self.messages[message.id] = message
+        return message
+
+    async def fetch_message(self, message_id):
+        await rest("channel.fetch_message")
+        return self.messages[message_id]
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self.done = False
+
+    def is_done(self):
+        return self.done
+
+    async def send_message(self, content=None, embed=None, view=None, ephemeral=False, **kwargs):
+        await rest("response.send_message")
+        self.done = True
+        if not ephemeral:
+            self.interaction.sent = await FakeChannel.send(self.interaction.channel, content, embed, view)
+            rest_calls["channel.send"] -= 1
+
+    async def edit_message(self, **kwargs):
+        await rest("response.edit_message")
+        self.done = True
+        self.interaction.message.apply(**kwargs)
+
+    async def defer(self, **kwargs):
+        await rest("response.defer")
+        self.done = True
+
+
+class FakeInteraction(discord.Interaction):
+    """Interaction minimale : seuls les attributs utilisés par le bot sont renseignés."""
+
+    guild = None
+
+    def __init__(self, user, channel, message=None, custom_id=None):
+        self.id = discord.utils.time_snowflake(discord.utils.utcnow())
+        self.user = user
+        self.channel = channel
+        self.guild = channel.guild
+        self.guild_id = channel.guild.id
+        self.message = message
+        self.data = {"custom_id": custom_id} if custom_id else {}
+        # Même emplacement que la réponse d'une vraie interaction, que le bot peut envelopper
+        self._cs_response = FakeResponse(self)
+        self.sent = None
+
+    async def original_response(self):
+        await rest("original_response")
+        return self.sent
+
+
+# --- SCÉNARIO ---
+latencies = collections.defaultdict(list)
+
+
+async def timed(name, coro):
+    start = time.perf_counter()
+    await coro
+    latencies[name].append(time.perf_counter() - start)
+
+
+async def click(name, view, user, message, custom_id=None):
+    interaction = FakeInteraction(user, message.channel, message, custom_id)
+    await timed(name, getattr(view, f"{name}_callback")(interaction))
+    return interaction
+
+
+async def play_lobby(lobby, rounds, players, channel, croupier):
+    for round_number in range(rounds):
+        base = (lobby * rounds + round_number) * 10 + 1
+        creator = FakeUser(base)
+        interaction = FakeInteraction(creator, channel)
+        await timed("duel", main.startgame.callback(interaction, 1000))
+        message = interaction.sent
+        view = message.view
+
+        await click("choose_number", view, creator, message, "number_1")
+        # Deux joueurs cliquent en même temps sur le même numéro : un seul doit l'obtenir
+        rivals = [FakeUser(base + 1), FakeUser(base + 2)]
+        await asyncio.gather(*(click("choose_number", view, rival, message, "number_2") for rival in rivals))
+        for offset in range(3, players + 1):
+            await click("choose_number", view, FakeUser(base + offset), message, f"number_{offset}")
+        # Le second rival prend un autre numéro, puis quitte la partie
+        loser = next(rival for rival in rivals if rival.id not in main.active_games.get(message.id).players)
+        await click("choose_number", view, loser, message, "number_6")
+        await click("cancel_game", view, loser, message)
+
+        await click("join_croupier", view, croupier, message)
+        await click("start_game_button", view, croupier, message)
+
+
+async def run(args):
+    global rest_latency
+    rest_latency = args.rest_latency
+    asyncio.sleep = fast_sleep
+    # Pas de limitation locale des éditions : on mesure le coût, pas la politique de débit
+    main.edit_scheduler.rate = main.edit_scheduler.capacity = float("inf")
+    main.db.start_flusher()
+
+    # Chaque serveur a son salon de jeu et ses rôles ; les lobbies sont répartis entre les serveurs
+    channels = []
+    for guild_id in range(1, args.guilds + 1):
+        guild = FakeGuild(guild_id)
+        channels.append(FakeChannel(guild))
+        await main.guild_configs.update(guild_id, game_channels=frozenset({channels[-1].id}), croupier_role_id=main.ID_CROUPIER, member_role_id=main.ID_MEMBRE)
+    croupiers = [FakeUser(1, roles=[channel.guild.roles[main.ID_CROUPIER]]) for channel in channels]
+
+    start = time.perf_counter()
+    await asyncio.gather(*(play_lobby(lobby, args.rounds, args.players, channels[lobby % args.guilds], croupiers[lobby % args.guilds]) for lobby in range(args.lobbies)))
+    elapsed = time.perf_counter() - start
+    await main.db.stop_flusher()
+
+    games = args.lobbies * args.rounds
+    clicks = sum(len(values) for values in latencies.values())
+    print(f"{games} parties, {clicks} interactions en {elapsed:.2f} s")
+    print(f"Débit : {clicks / elapsed:,.0f} interactions/s, {games / elapsed:,.1f} parties/s")
+    print()
+    print(f"{'callback':<20}{'n':>8}{'p50 (ms)':>12}{'p99 (ms)':>12}")
+    for name, values in sorted(latencies.items()):
+        values.sort()
+        p99 = values[min(len(values) - 1, int(len(values) * 0.99))]
+        print(f"{name:<20}{len(values):>8}{statistics.median(values) * 1000:>12.2f}{p99 * 1000:>12.2f}")
+    print()
+    total = sum(rest_calls.values())
+    print(f"Appels REST : {total} ({total / games:.1f} par partie)")
+    for name, count in rest_calls.most_common():
+        print(f"  {name:<26}{count:>8}")
+    print(f"Éditions : {main.edit_scheduler.sent} envoyées, {main.edit_scheduler.coalesced} fusionnées, {main.edit_scheduler.skipped} ignorées")
+    print(f"Base : {main.db.flushed_games} parties écrites en {main.db.flush_count} lots")
+    if len(main.active_games):
+        print(f"Attention : {len(main.active_games)} parties sont restées ouvertes")
+    if main.edit_scheduler._last:
+        print(f"Attention : {len(main.edit_scheduler._last)} messages sont restés dans l'EditScheduler")
+    main.db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lobbies", type=int, default=50, help="lobbies joués en parallèle")
+    parser.add_argument("--guilds", type=int, default=1, help="serveurs entre lesquels les lobbies sont répartis")
+    parser.add_argument("--rounds", type=int, default=20, help="parties successives par lobby")
+    parser.add_argument("--players", type=int, default=4, help="joueurs par partie (3 à 5)")
+    parser.add_argument("--rest-latency", type=float, default=0.0, help="latence simulée de chaque appel REST, en secondes")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,81 @@
+"""Micro-benchmark du rendu d'un lobby à chaque clic.
+
+Mesure le coût d'une inscription suivie d'un départ (boutons + champs de l'embed),
+comparé à une reconstruction complète des boutons comme avant le rendu incrémental.
+
+    python bench/lobby_render.py [--clicks 20000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GAME_STATS_DB", os.path.join(tempfile.mkdtemp(), "game_stats.db"))
+
+import discord  # noqa: E402
+import main  # noqa: E402
+from games import Game, Participant  # noqa: E402
+
+
+def lobby_embed():
+    embed = discord.Embed(title="🔮 Nouvelle Partie de Numéro Mystère")
+    embed.add_field(name="Joueurs inscrits", value="...", inline=False)
+    embed.add_field(name="Status", value="...", inline=False)
+    return embed
+
+
+def full_rebuild(view):
+    # Ancien comportement : tous les boutons recréés et la liste des joueurs reconstruite
+    view.clear_items()
+    taken = {p.number for p in view.game.players.values()}
+    for i in range(1, 7):
+        button = discord.ui.Button(label=main.EMOJI_MAPPING[i], style=discord.ButtonStyle.secondary, custom_id=f"number_{i}")
+        if i in taken:
+            button.disabled = True
+            button.style = discord.ButtonStyle.danger
+        view.add_item(button)
+    view.add_item(discord.ui.Button(label="❌ Annuler", style=discord.ButtonStyle.red, custom_id="cancel_game"))
+    next(item for item in view.children if item.custom_id == "number_1")
+    return "\n".join(f"{p.mention} a choisi le numéro **{main.EMOJI_MAPPING[p.number]}**" for p in view.game.players.values() if p.number is not None)
+
+
+async def run(clicks):
+    game = Game(1, 1, 100, 1000, 6)
+    game.players[100] = Participant(100, "créateur", 1)
+    main.active_games.add(1, game)
+    view = main.GameView(1, 6, 1000, 100)
+    embed = lobby_embed()
+    for user_id in range(101, 105):
+        participant = Participant(user_id, f"joueur {user_id}", user_id - 99)
+        main.active_games.add_player(1, participant)
+        view.render_join(embed, participant)
+
+    extra = Participant(200, "joueur 200", 6)
+    start = time.perf_counter()
+    for _ in range(clicks):
+        main.active_games.add_player(1, extra)
+        view.render_join(embed, extra)
+        main.active_games.remove_player(1, extra.user_id)
+        view.render_leave(embed, extra)
+    incremental = (time.perf_counter() - start) / (2 * clicks)
+
+    start = time.perf_counter()
+    for _ in range(clicks):
+        main.active_games.add_player(1, extra)
+        full_rebuild(view)
+        main.active_games.remove_player(1, extra.user_id)
+        full_rebuild(view)
+    rebuild = (time.perf_counter() - start) / (2 * clicks)
+
+    print(f"Rendu incrémental : {incremental * 1e6:8.2f} µs / clic")
+    print(f"Reconstruction    : {rebuild * 1e6:8.2f} µs / clic")
+    main.db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clicks", type=int, default=20000)
+    asyncio.run(run(parser.parse_args().clicks))
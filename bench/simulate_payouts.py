@@ -0,0 +1,208 @@
+"""Simulation Monte-Carlo des gains, de la commission et de la durée des parties.
+
+Reproduit par blocs NumPy les règles de fin de partie de main.py :
+numéros distincts de 1 à 6, numéro gagnant uniforme parmi les numéros choisis,
+commission `int(pot * taux)`, gain `pot_net // nb_gagnants`, lancers ratés
+(animés au plus RELANCES_ANIMEES_MAX fois en mode direct, tous joués en mode relance).
+Affiche l'avantage de la maison, la commission perçue (et son écart au calcul exact),
+les kamas perdus par les arrondis, l'équité par numéro et par place d'inscription,
+et la distribution du nombre de relances et de la durée d'une partie.
+
+Nécessite NumPy, en plus des dépendances du bot : pip install -r bench/requirements.txt
+
+    python bench/simulate_payouts.py [--games 5000000] [--commission 5] [--mode direct|relance] [--players 2 6] [--duplicates]
+"""
+import argparse
+import os
+import sys
+import time
+from fractions import Fraction
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from guilds import GuildConfig  # noqa: E402
+
+# Temps d'attente de _end_game, en secondes
+COMPTE_A_REBOURS = 5
+PAUSE_RELANCE_ANIMEE = 2
+PAUSE_RELANCE = 4
+RELANCES_ANIMEES_MAX = 2
+CHUNK = 1_000_000
+MAX_HISTOGRAM = 40
+
+
+class Totals:
+    """Cumuls des blocs simulés."""
+
+    def __init__(self, max_players):
+        self.games = 0
+        self.staked = 0
+        self.commission = 0
+        self.commission_exact = 0
+        self.commission_off = 0
+        self.paid = 0
+        self.remainder = 0
+        self.split_games = 0
+        self.seat_plays = np.zeros(max_players, dtype=np.int64)
+        self.seat_wins = np.zeros(max_players, dtype=np.int64)
+        self.seat_expected = np.zeros(max_players)
+        self.number_picks = np.zeros(6, dtype=np.int64)
+        self.number_wins = np.zeros(6, dtype=np.int64)
+        self.rerolls = np.zeros(MAX_HISTOGRAM + 1, dtype=np.int64)
+        self.duration = {}
+        self.by_players = {}
+
+
+def simulate_chunk(rng, n, totals, min_players, max_players, stakes, rate, mode, duplicates, max_missed):
+    k = rng.integers(min_players, max_players + 1, size=n)
+    mask = np.arange(max_players) < k[:, None]
+    if duplicates:
+        numbers = rng.integers(1, 7, size=(n, max_players))
+    else:
+        # Règle actuelle : un numéro déjà pris est désactivé, les numéros d'une partie sont distincts
+        numbers = np.argsort(rng.random((n, 6)), axis=1)[:, :max_players] + 1
+
+    # Numéros présents dans chaque partie (un numéro choisi par deux joueurs ne compte qu'une fois)
+    rows = np.arange(n)
+    present = np.zeros((n, 6), dtype=bool)
+    for slot in range(max_players):
+        active = mask[:, slot]
+        present[rows[active], numbers[active, slot] - 1] = True
+    distinct = present.sum(axis=1)
+
+    # Tirage uniforme parmi les numéros choisis : même loi que draw_winning_number et que les relances
+    pick = (rng.random(n) * distinct).astype(np.int64)
+    winning = np.argmax(np.cumsum(present, axis=1) > pick[:, None], axis=1) + 1
+    is_winner = (numbers == winning[:, None]) & mask
+    nb_winners = is_winner.sum(axis=1)
+
+    montant = np.asarray(stakes, dtype=np.int64)[rng.integers(0, len(stakes), size=n)]
+    pot = montant * k
+    # int(total_pot * taux) : multiplication en flottant puis troncature, comme en Python
+    commission = (pot * rate).astype(np.int64)
+    exact = Fraction(rate).limit_denominator(100_000)
+    commission_exact = pot * exact.numerator // exact.denominator
+    net = pot - commission
+    gain = net // nb_winners
+    paid = gain * nb_winners
+
+    # Nombre de lancers jusqu'au premier numéro choisi : loi géométrique de paramètre (numéros choisis) / 6
+    rolls = rng.geometric(distinct / 6)
+    if mode == "direct":
+        rerolls = np.minimum(rolls - 1, max_missed)
+        duration = COMPTE_A_REBOURS + PAUSE_RELANCE_ANIMEE * rerolls
+    else:
+        rerolls = rolls - 1
+        duration = COMPTE_A_REBOURS * rolls + PAUSE_RELANCE * rerolls
+
+    totals.games += n
+    totals.staked += int(pot.sum())
+    totals.commission += int(commission.sum())
+    totals.commission_exact += int(commission_exact.sum())
+    totals.commission_off += int((commission != commission_exact).sum())
+    totals.paid += int(paid.sum())
+    totals.remainder += int((net - paid).sum())
+    totals.split_games += int((nb_winners > 1).sum())
+    totals.seat_plays += mask.sum(axis=0)
+    totals.seat_wins += is_winner.sum(axis=0)
+    # Chance attendue d'une place : 1 / k avec des numéros distincts, selon le nombre de joueurs de la partie
+    totals.seat_expected += (mask / k[:, None]).sum(axis=0)
+    totals.number_picks += np.bincount(numbers[mask] - 1, minlength=6)
+    totals.number_wins += np.bincount(winning - 1, minlength=6)
+    totals.rerolls += np.bincount(np.minimum(rerolls, MAX_HISTOGRAM), minlength=MAX_HISTOGRAM + 1)
+    for seconds, count in zip(*np.unique(duration, return_counts=True)):
+        totals.duration[int(seconds)] = totals.duration.get(int(seconds), 0) + int(count)
+    for players in range(min_players, max_players + 1):
+        selected = k == players
+        stats = totals.by_players.setdefault(players, [0, 0, 0, 0])
+        stats[0] += int(selected.sum())
+        stats[1] += int(pot[selected].sum())
+        stats[2] += int(paid[selected].sum())
+        stats[3] += int(rerolls[selected].sum())
+
+
+def percentile(histogram, q):
+    """Percentile d'une distribution donnée par {valeur: effectif}."""
+    total = sum(histogram.values())
+    seen = 0
+    for value in sorted(histogram):
+        seen += histogram[value]
+        if seen >= q * total:
+            return value
+    return max(histogram)
+
+
+def kamas(value):
+    return f"{value:,.0f}".replace(",", " ")
+
+
+def report(totals, args, elapsed):
+    staked = totals.staked
+    print(f"{kamas(totals.games)} parties simulées en {elapsed:.1f} s ({kamas(totals.games / elapsed)} parties/s)")
+    print(f"Mode {args.mode}, {args.players[0]} à {args.players[1]} joueurs, commission {args.commission:g} %, "
+          f"{'numéros partagés autorisés' if args.duplicates else 'numéros distincts'}")
+    print()
+    print(f"{'Total misé':<36}{kamas(staked):>22} kamas")
+    print(f"{'Versé aux gagnants':<36}{kamas(totals.paid):>22} kamas")
+    print(f"{'Commission perçue':<36}{kamas(totals.commission):>22} kamas ({totals.commission / staked:.4%})")
+    print(f"{'Commission au taux exact':<36}{kamas(totals.commission_exact):>22} kamas "
+          f"(écart {kamas(totals.commission_exact - totals.commission)}, {kamas(totals.commission_off)} parties touchées par l'arrondi flottant)")
+    print(f"{'Perdu par la division du pot net':<36}{kamas(totals.remainder):>22} kamas ({kamas(totals.split_games)} parties partagées)")
+    print(f"{'Avantage de la maison':<36}{(staked - totals.paid) / staked:>22.4%}")
+    print(f"{'Retour moyen aux joueurs':<36}{totals.paid / staked:>22.4%}")
+
+    print()
+    print("Équité par numéro (part des numéros choisis / part des victoires)")
+    picks = totals.number_picks / totals.number_picks.sum()
+    wins = totals.number_wins / totals.games
+    for number in range(6):
+        print(f"  {number + 1}  {picks[number]:8.3%}  {wins[number]:8.3%}")
+    print("Équité par place d'inscription (victoires observées / attendues à chances égales, 1 = créateur)")
+    for seat in range(args.players[1]):
+        if totals.seat_plays[seat]:
+            print(f"  {seat + 1}  {totals.seat_wins[seat] / totals.seat_expected[seat]:8.4f}  sur {kamas(totals.seat_plays[seat])} participations")
+
+    print()
+    print(f"{'joueurs':<10}{'parties':>14}{'avantage':>12}{'relances moy.':>16}")
+    for players, (games, pot, paid, rerolls) in sorted(totals.by_players.items()):
+        if games:
+            print(f"{players:<10}{kamas(games):>14}{(pot - paid) / pot:>12.3%}{rerolls / games:>16.3f}")
+
+    print()
+    print("Relances par partie")
+    for rerolls, count in enumerate(totals.rerolls):
+        if count and count / totals.games >= 1e-4:
+            label = f"{rerolls}+" if rerolls == MAX_HISTOGRAM else str(rerolls)
+            print(f"  {label:>4}  {count / totals.games:8.3%}")
+    mean = sum(seconds * count for seconds, count in totals.duration.items()) / totals.games
+    print(f"Durée du tirage : moyenne {mean:.1f} s, p50 {percentile(totals.duration, 0.5)} s, "
+          f"p90 {percentile(totals.duration, 0.9)} s, p99 {percentile(totals.duration, 0.99)} s, max {max(totals.duration)} s")
+
+
+def main(args):
+    if not 1 <= args.players[0] <= args.players[1] <= 6:
+        raise SystemExit("Le nombre de joueurs doit être compris entre 1 et 6.")
+    rng = np.random.default_rng(args.seed)
+    stakes = [int(stake) for stake in args.stakes.split(",")]
+    totals = Totals(args.players[1])
+    start = time.perf_counter()
+    for offset in range(0, args.games, CHUNK):
+        simulate_chunk(rng, min(CHUNK, args.games - offset), totals, *args.players, stakes,
+                       args.commission / 100, args.mode, args.duplicates, args.max_missed)
+    report(totals, args, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    defaults = GuildConfig(0)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=5_000_000, help="nombre de parties simulées")
+    parser.add_argument("--commission", type=float, default=defaults.commission * 100, help="commission en pourcentage du pot")
+    parser.add_argument("--mode", choices=("direct", "relance"), default="direct", help="MODE_TIRAGE simulé")
+    parser.add_argument("--players", type=int, nargs=2, default=(2, defaults.max_players), metavar=("MIN", "MAX"), help="joueurs par partie")
+    parser.add_argument("--stakes", default="1000,5000,10000,50000,100000", help="mises possibles, séparées par des virgules")
+    parser.add_argument("--duplicates", action="store_true", help="autorise plusieurs joueurs sur le même numéro (égalités)")
+    parser.add_argument("--max-missed", type=int, default=RELANCES_ANIMEES_MAX, help="lancers ratés animés au plus, en mode direct")
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
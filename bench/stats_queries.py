@@ -0,0 +1,158 @@
+"""Banc d'essai des requêtes de /statsall et /mystats selon la taille de l'historique.
+
+Pour chaque taille, une base synthétique est générée (voir generate_history.py), puis
+chaque requête est chronométrée : celles du bot, appelées par les méthodes de Database,
+et des plans alternatifs qui agrègent directement `participants` sans passer par les cumuls.
+Le plan d'exécution (EXPLAIN QUERY PLAN) de chaque requête est affiché pour la dernière taille.
+
+Nécessite NumPy, en plus des dépendances du bot : pip install -r bench/requirements.txt
+
+    python bench/stats_queries.py [--sizes 10000,100000,1000000] [--repeat 20] [--keep DOSSIER]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import FULL_STATS_QUERY, Database  # noqa: E402
+from generate_history import GUILD_ID, generate  # noqa: E402
+
+PER_PAGE = 10
+
+
+def current_queries(db, player, period):
+    """Requêtes du bot, telles que les émettent les méthodes de Database."""
+    count = db._count_players(GUILD_ID, None)
+    middle = (count // PER_PAGE // 2) * PER_PAGE
+    first = db._fetch_leaderboard_page(GUILD_ID, PER_PAGE, None, None, 0, False, None)
+    after = (first[-1][3], first[-1][0])
+    return [
+        ("statsall : nombre de joueurs", lambda: db._count_players(GUILD_ID, None)),
+        ("statsall : première page", lambda: db._fetch_leaderboard_page(GUILD_ID, PER_PAGE, None, None, 0, False, None)),
+        ("statsall : page suivante (clé)", lambda: db._fetch_leaderboard_page(GUILD_ID, PER_PAGE, after, None, 0, False, None)),
+        ("statsall : page du milieu (OFFSET)", lambda: db._fetch_leaderboard_page(GUILD_ID, PER_PAGE, None, None, middle, False, None)),
+        ("statsall : dernière page", lambda: db._fetch_leaderboard_page(GUILD_ID, PER_PAGE, None, None, 0, True, None)),
+        ("statsall 30 j : nombre de joueurs", lambda: db._count_players(GUILD_ID, period)),
+        ("statsall 30 j : première page", lambda: db._fetch_leaderboard_page(GUILD_ID, PER_PAGE, None, None, 0, False, period)),
+        ("mystats", lambda: db._fetch_player_stats(GUILD_ID, player, None)),
+        ("mystats 30 j", lambda: db._fetch_player_stats(GUILD_ID, player, period)),
+    ]
+
+
+def alternative_queries(player, period):
+    """Plans alternatifs : agrégation à la volée de l'historique, sans les tables de cumul."""
+    start, end = period
+    return [
+        ("alt. statsall : agrégation complète", f"""
+        SELECT * FROM ({FULL_STATS_QUERY})
+        WHERE guild_id = ?
+        ORDER BY total_gagnes DESC, joueur_id DESC
+        LIMIT {PER_PAGE}
+        """, (GUILD_ID,)),
+        ("alt. statsall 30 j : participants + rounds", f"""
+        SELECT p.joueur_id, COUNT(*), SUM(p.montant), SUM(p.gain) AS total_gagnes, SUM(p.is_winner)
+        FROM rounds r
+        JOIN participants p ON p.game_id = r.game_id
+        WHERE r.date >= ? AND r.date < date(?, '+1 day') AND r.guild_id = ?
+        GROUP BY p.joueur_id
+        ORDER BY total_gagnes DESC, p.joueur_id DESC
+        LIMIT {PER_PAGE}
+        """, (start, end, GUILD_ID)),
+        ("alt. mystats : index participants", """
+        SELECT SUM(montant), SUM(gain), SUM(is_winner), COUNT(*)
+        FROM participants
+        WHERE guild_id = ? AND joueur_id = ?
+        """, (GUILD_ID, player)),
+        ("alt. mystats 30 j : participants + rounds", """
+        SELECT SUM(p.montant), SUM(p.gain), SUM(p.is_winner), COUNT(*)
+        FROM participants p
+        JOIN rounds r ON r.game_id = p.game_id
+        WHERE p.guild_id = ? AND p.joueur_id = ? AND r.date >= ? AND r.date < date(?, '+1 day')
+        """, (GUILD_ID, player, start, end)),
+    ]
+
+
+def timed(func, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations) * 1000, max(durations) * 1000
+
+
+def explain(conn, sql, params=()):
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()]
+
+
+def bench_size(path, repeat):
+    db = Database(path)
+    conn = db._read_conn()
+    # Le joueur le plus actif : c'est pour lui que /mystats est le plus coûteux
+    player = conn.execute("SELECT joueur_id FROM player_stats ORDER BY total_parties DESC LIMIT 1").fetchone()[0]
+    today = date.fromisoformat(conn.execute("SELECT MAX(date(date)) FROM rounds").fetchone()[0])
+    period = ((today - timedelta(days=29)).isoformat(), today.isoformat())
+
+    results = {}
+    plans = {}
+    # Le SQL exécuté par les méthodes du bot est récupéré, paramètres inclus, par le traçage
+    traced = []
+    conn.set_trace_callback(traced.append)
+    for name, func in current_queries(db, player, period):
+        traced.clear()
+        func()
+        plans[name] = [explain(conn, sql) for sql in traced if sql.lstrip().upper().startswith(("SELECT", "WITH"))]
+        results[name] = timed(func, repeat)
+    conn.set_trace_callback(None)
+
+    for name, sql, params in alternative_queries(player, period):
+        plans[name] = [explain(conn, sql, params)]
+        results[name] = timed(lambda: conn.execute(sql, params).fetchall(), repeat)
+    db.close()
+    return results, plans
+
+
+def main(args):
+    sizes = [int(size) for size in args.sizes.split(",")]
+    folder = args.keep or tempfile.mkdtemp()
+    table = {}
+    plans = {}
+    for size in sizes:
+        path = os.path.join(folder, f"history_{size}.db")
+        if not os.path.exists(path):
+            print(f"Génération de {size:,} parties...")
+            t0 = time.perf_counter()
+            generate(path, size, tie_rate=args.tie_rate, pool=args.pool, seed=args.seed, quiet=True)
+            print(f"  {time.perf_counter() - t0:.1f} s, {os.path.getsize(path) / 1e6:,.0f} Mo")
+        table[size], plans = bench_size(path, args.repeat)
+
+    print()
+    header = "".join(f"{size:>18,}" for size in sizes)
+    print(f"{'médiane / max (ms)':<44}{header}")
+    for name in table[sizes[0]]:
+        cells = "".join(f"{table[size][name][0]:>10.2f} /{table[size][name][1]:>6.2f}" for size in sizes)
+        print(f"{name:<44}{cells}")
+
+    print()
+    print(f"Plans d'exécution ({sizes[-1]:,} parties)")
+    for name, queries in plans.items():
+        print(f"\n{name}")
+        for steps in queries:
+            for step in steps:
+                print(f"    {step}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="nombres de parties, séparés par des virgules")
+    parser.add_argument("--repeat", type=int, default=20, help="exécutions par requête")
+    parser.add_argument("--tie-rate", type=float, default=0.01)
+    parser.add_argument("--pool", type=int, default=5000, help="nombre de joueurs distincts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", help="dossier où garder (et réutiliser) les bases générées")
+    main(parser.parse_args())
@@ -0,0 +1,757 @@
+import asyncio
+import csv
+import gzip
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+from metrics import collector
+
+# --- SCHÉMA ET MIGRATIONS ---
+# Chaque migration fait passer la base de la version i à i + 1 (PRAGMA user_version)
+
+# Version 1 : schéma historique, une ligne par joueur et par partie
+SCHEMA_V1 = """
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    game_id INTEGER NOT NULL,
+    joueur_id INTEGER NOT NULL,
+    montant INTEGER NOT NULL,
+    numero_choisi INTEGER NOT NULL,
+    gagnant_id INTEGER,
+    numero_resultat INTEGER,
+    date TIMESTAMP NOT NULL
+);
+
+-- Table de cumul par joueur, mise à jour à chaque partie (évite de ré-agréger tout l'historique)
+CREATE TABLE IF NOT EXISTS player_stats (
+    joueur_id INTEGER PRIMARY KEY,
+    total_parties INTEGER NOT NULL DEFAULT 0,
+    total_mises INTEGER NOT NULL DEFAULT 0,
+    total_gagnes REAL NOT NULL DEFAULT 0,
+    victoires INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# Version 2 : une ligne par partie (rounds) et une ligne par joueur inscrit (participants).
+# Les gagnants sont retrouvés à partir des numéros, ce qui corrige les égalités
+# que l'ancien schéma enregistrait avec le seul premier gagnant.
+SCHEMA_V2 = """
+CREATE TABLE rounds (
+    game_id INTEGER PRIMARY KEY,
+    montant INTEGER NOT NULL,
+    pot INTEGER NOT NULL,
+    commission INTEGER NOT NULL,
+    numero_resultat INTEGER NOT NULL,
+    nb_gagnants INTEGER NOT NULL,
+    date TIMESTAMP NOT NULL
+);
+
+CREATE TABLE participants (
+    game_id INTEGER NOT NULL REFERENCES rounds(game_id),
+    joueur_id INTEGER NOT NULL,
+    numero_choisi INTEGER NOT NULL,
+    montant INTEGER NOT NULL,
+    is_winner INTEGER NOT NULL,
+    gain INTEGER NOT NULL,
+    PRIMARY KEY (game_id, joueur_id)
+) WITHOUT ROWID;
+
+INSERT INTO rounds (game_id, montant, pot, commission, numero_resultat, nb_gagnants, date)
+SELECT
+  game_id,
+  MAX(montant),
+  SUM(montant),
+  CAST(SUM(montant) * 0.05 AS INTEGER),
+  MAX(numero_resultat),
+  SUM(numero_choisi = numero_resultat),
+  MIN(date)
+FROM games
+GROUP BY game_id;
+
+INSERT OR IGNORE INTO participants (game_id, joueur_id, numero_choisi, montant, is_winner, gain)
+SELECT
+  g.game_id,
+  g.joueur_id,
+  g.numero_choisi,
+  g.montant,
+  g.numero_choisi = r.numero_resultat,
+  CASE
+    WHEN g.numero_choisi = r.numero_resultat THEN (r.pot - r.commission) / r.nb_gagnants
+    ELSE 0
+  END
+FROM games g
+JOIN rounds r ON g.game_id = r.game_id;
+
+DROP TABLE games;
+
+-- Index couvrant pour les agrégations par joueur, sans passer par la table
+CREATE INDEX idx_participants_joueur ON participants (joueur_id, montant, gain, is_winner);
+CREATE INDEX idx_rounds_date ON rounds (date);
+CREATE INDEX idx_player_stats_gagnes ON player_stats (total_gagnes DESC);
+"""
+
+# Version 3 : instantané des parties ouvertes, pour les restaurer après un redémarrage
+SCHEMA_V3 = """
+CREATE TABLE open_games (
+    message_id INTEGER PRIMARY KEY,
+    channel_id INTEGER NOT NULL,
+    creator_id INTEGER NOT NULL,
+    montant INTEGER NOT NULL,
+    player_limit INTEGER NOT NULL,
+    croupier_id INTEGER,
+    players TEXT NOT NULL,
+    updated_at TIMESTAMP NOT NULL
+);
+"""
+
+# Version 4 : index du classement sur la clé complète de pagination (total_gagnes, joueur_id)
+SCHEMA_V4 = """
+DROP INDEX idx_player_stats_gagnes;
+CREATE INDEX idx_player_stats_classement ON player_stats (total_gagnes, joueur_id);
+"""
+
+# Version 5 : cumul quotidien par joueur, pour les statistiques sur une période
+SCHEMA_V5 = """
+CREATE TABLE player_daily_stats (
+    jour TEXT NOT NULL,
+    joueur_id INTEGER NOT NULL,
+    total_parties INTEGER NOT NULL DEFAULT 0,
+    total_mises INTEGER NOT NULL DEFAULT 0,
+    total_gagnes REAL NOT NULL DEFAULT 0,
+    victoires INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (jour, joueur_id)
+) WITHOUT ROWID;
+
+CREATE INDEX idx_player_daily_stats_joueur ON player_daily_stats (joueur_id, jour);
+"""
+
+# Version 6 : plusieurs serveurs. Configuration par serveur, historique et cumuls partitionnés
+# par serveur (guild_id vaut 0 pour l'historique d'avant, rattaché ensuite au serveur d'origine).
+# Les tables de cumul changent de clé : elles sont recréées puis reconstruites depuis l'historique.
+SCHEMA_V6 = """
+CREATE TABLE guild_config (
+    guild_id INTEGER PRIMARY KEY,
+    game_channels TEXT NOT NULL DEFAULT '[]',
+    croupier_role_id INTEGER,
+    member_role_id INTEGER,
+    commission REAL NOT NULL DEFAULT 0.05,
+    max_players INTEGER NOT NULL DEFAULT 6
+);
+
+ALTER TABLE rounds ADD COLUMN guild_id INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE participants ADD COLUMN guild_id INTEGER NOT NULL DEFAULT 0;
+DROP INDEX idx_participants_joueur;
+CREATE INDEX idx_participants_joueur ON participants (guild_id, joueur_id, montant, gain, is_winner);
+
+DROP TABLE player_stats;
+CREATE TABLE player_stats (
+    guild_id INTEGER NOT NULL,
+    joueur_id INTEGER NOT NULL,
+    total_parties INTEGER NOT NULL DEFAULT 0,
+    total_mises INTEGER NOT NULL DEFAULT 0,
+    total_gagnes REAL NOT NULL DEFAULT 0,
+    victoires INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, joueur_id)
+) WITHOUT ROWID;
+CREATE INDEX idx_player_stats_classement ON player_stats (guild_id, total_gagnes, joueur_id);
+
+DROP TABLE player_daily_stats;
+CREATE TABLE player_daily_stats (
+    guild_id INTEGER NOT NULL,
+    jour TEXT NOT NULL,
+    joueur_id INTEGER NOT NULL,
+    total_parties INTEGER NOT NULL DEFAULT 0,
+    total_mises INTEGER NOT NULL DEFAULT 0,
+    total_gagnes REAL NOT NULL DEFAULT 0,
+    victoires INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, jour, joueur_id)
+) WITHOUT ROWID;
+CREATE INDEX idx_player_daily_stats_joueur ON player_daily_stats (guild_id, joueur_id, jour);
+"""
+
+# Version 7 : serveur de chaque partie ouverte, pour que chaque processus ne restaure que ses shards
+SCHEMA_V7 = """
+ALTER TABLE open_games ADD COLUMN guild_id INTEGER;
+"""
+
+# Version 8 : index de l'historique. L'identifiant d'une partie est celui de son message
+# (un snowflake, croissant dans le temps) : trier par game_id revient à trier par date.
+SCHEMA_V8 = """
+CREATE INDEX idx_participants_historique ON participants (guild_id, joueur_id, game_id);
+CREATE INDEX idx_rounds_guild ON rounds (guild_id, game_id);
+"""
+
+MIGRATIONS = [SCHEMA_V1, SCHEMA_V2, SCHEMA_V3, SCHEMA_V4, SCHEMA_V5, SCHEMA_V6, SCHEMA_V7, SCHEMA_V8]
+
+# Colonnes de l'export de l'historique : une ligne par joueur et par partie
+EXPORT_COLUMNS = ("game_id", "date", "montant", "pot", "commission", "numero_resultat", "nb_gagnants", "joueur_id", "numero_choisi", "is_winner", "gain")
+EXPORT_CHUNK = 5000
+
+# Écritures qu'un processus de shards peut demander au processus écrivain (voir Database.serve)
+REMOTE_WRITES = {"_log_games", "_rebuild_stats", "_save_open_game", "_delete_open_game", "_save_guild_config", "_adopt_legacy_history"}
+
+# Agrégation complète de l'historique, utilisée pour reconstruire et vérifier player_stats
+FULL_STATS_QUERY = """
+SELECT
+  guild_id,
+  joueur_id,
+  COUNT(*) AS total_parties,
+  SUM(montant) AS total_mises,
+  SUM(gain) AS total_gagnes,
+  SUM(is_winner) AS victoires
+FROM participants
+GROUP BY guild_id, joueur_id
+"""
+
+# Même agrégation, par jour, utilisée pour reconstruire player_daily_stats
+FULL_DAILY_STATS_QUERY = """
+SELECT
+  p.guild_id,
+  date(r.date) AS jour,
+  p.joueur_id,
+  COUNT(*) AS total_parties,
+  SUM(p.montant) AS total_mises,
+  SUM(p.gain) AS total_gagnes,
+  SUM(p.is_winner) AS victoires
+FROM participants p
+JOIN rounds r ON p.game_id = r.game_id
+GROUP BY p.guild_id, jour, p.joueur_id
+"""
+
+# Cumul de chaque joueur d'un serveur sur une période [jour de début, jour de fin]
+WINDOW_STATS_QUERY = """
+SELECT
+  joueur_id,
+  SUM(total_parties) AS total_parties,
+  SUM(total_mises) AS total_mises,
+  SUM(total_gagnes) AS total_gagnes,
+  SUM(victoires) AS victoires
+FROM player_daily_stats
+WHERE guild_id = ? AND jour BETWEEN ? AND ?
+GROUP BY joueur_id
+"""
+
+UPSERT_PLAYER_DAILY_STATS = """
+INSERT INTO player_daily_stats (guild_id, jour, joueur_id, total_parties, total_mises, total_gagnes, victoires) VALUES (?, ?, ?, 1, ?, ?, ?)
+ON CONFLICT(guild_id, jour, joueur_id) DO UPDATE SET
+  total_parties = total_parties + excluded.total_parties,
+  total_mises = total_mises + excluded.total_mises,
+  total_gagnes = total_gagnes + excluded.total_gagnes,
+  victoires = victoires + excluded.victoires
+"""
+
+UPSERT_PLAYER_STATS = """
+INSERT INTO player_stats (guild_id, joueur_id, total_parties, total_mises, total_gagnes, victoires) VALUES (?, ?, 1, ?, ?, ?)
+ON CONFLICT(guild_id, joueur_id) DO UPDATE SET
+  total_parties = total_parties + excluded.total_parties,
+  total_mises = total_mises + excluded.total_mises,
+  total_gagnes = total_gagnes + excluded.total_gagnes,
+  victoires = victoires + excluded.victoires
+"""
+
+
+class Database:
+    """Accès SQLite hors de la boucle asyncio.
+
+    Toutes les écritures passent par une connexion unique sur un thread dédié ;
+    les lectures utilisent des connexions en lecture seule (une par thread du pool),
+    ce que le mode WAL permet en parallèle des écritures.
+
+    Quand le bot est réparti sur plusieurs processus, un seul d'entre eux écrit : les
+    autres reçoivent `writer_address` et lui envoient leurs écritures (voir `serve`),
+    au lieu de se disputer le verrou d'écriture du fichier. Les lectures restent locales.
+    """
+
+    def __init__(self, path="game_stats.db", readers=4, flush_size=50, flush_interval=1.0, writer_address=None, writer_key=None):
+        self.path = path
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-reader")
+        self._local = threading.local()
+        self._read_conns = []
+        self._write_conn = None
+        self._writer_client = None
+        # File d'attente des parties terminées, écrites par lots par le flusher
+        self._pending = []
+        self._flush_event = None
+        self._flush_lock = None
+        self._flusher = None
+        self._stopping = False
+        self.flush_count = 0
+        # Générations des statistiques, pour invalider les caches : une par serveur,
+        # plus une époque incrémentée quand tous les serveurs sont reconstruits
+        self._stats_epoch = 0
+        self._generations = {}
+        self.flushed_games = 0
+        self.last_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+        # Le schéma doit exister avant d'ouvrir les connexions en lecture seule ;
+        # avec un écrivain distant, c'est lui qui l'a créé et migré
+        if writer_address:
+            self._writer.submit(self._connect_writer, writer_address, writer_key).result()
+        else:
+            self._writer.submit(self._init_schema).result()
+
+    # --- CONNEXIONS ---
+    def _init_schema(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        self._write_conn = conn
+        self._migrate()
+
+    def _migrate(self):
+        conn = self._write_conn
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= len(MIGRATIONS):
+            return
+        for target in range(version + 1, len(MIGRATIONS) + 1):
+            # executescript valide la transaction en cours : on encadre nous-mêmes la migration
+            conn.executescript(f"BEGIN; {MIGRATIONS[target - 1]} PRAGMA user_version = {target}; COMMIT;")
+            print(f"Base de données migrée en version {target}.")
+        # Les cumuls sont recalculés à partir des données migrées
+        self._rebuild_stats()
+
+    def _connect_writer(self, address, key):
+        self._writer_client = Client(address, authkey=key)
+
+    def _remote_write(self, name, *args):
+        # Appelé sur le thread d'écriture : une seule requête en cours par processus
+        self._writer_client.send((name, args))
+        ok, value = self._writer_client.recv()
+        if not ok:
+            raise value
+        return value
+
+    def _read_conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self._local.conn = conn
+            self._read_conns.append(conn)
+        return conn
+
+    async def _write(self, func, *args):
+        with collector.timer("numero_db_query_seconds", op=func.__name__.lstrip("_")):
+            if self._writer_client:
+                return await asyncio.get_running_loop().run_in_executor(self._writer, self._remote_write, func.__name__, *args)
+            return await asyncio.get_running_loop().run_in_executor(self._writer, func, *args)
+
+    async def _read(self, func, *args):
+        with collector.timer("numero_db_query_seconds", op=func.__name__.lstrip("_")):
+            return await asyncio.get_running_loop().run_in_executor(self._readers, func, *args)
+
+    # --- ÉCRITURES ---
+    def _log_games(self, records):
+        conn = self._write_conn
+        round_rows = []
+        participant_rows = []
+        stats_rows = []
+        daily_rows = []
+        for guild_id, game_id, montant, numbers, winners, numero_resultat, commission, gain, date in records:
+            round_rows.append((game_id, guild_id, montant, montant * len(numbers), commission, numero_resultat, len(winners), date))
+            # Même format que date() en SQL : "AAAA-MM-JJ"
+            jour = str(date)[:10]
+            for player_id, number in numbers.items():
+                is_winner = player_id in winners
+                player_gain = gain if is_winner else 0
+                participant_rows.append((game_id, guild_id, player_id, number, montant, is_winner, player_gain))
+                stats_rows.append((guild_id, player_id, montant, player_gain, 1 if is_winner else 0))
+                daily_rows.append((guild_id, jour, player_id, montant, player_gain, 1 if is_winner else 0))
+        try:
+            conn.executemany("INSERT INTO rounds (game_id, guild_id, montant, pot, commission, numero_resultat, nb_gagnants, date) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", round_rows)
+            conn.executemany("INSERT INTO participants (game_id, guild_id, joueur_id, numero_choisi, montant, is_winner, gain) VALUES (?, ?, ?, ?, ?, ?, ?)", participant_rows)
+            conn.executemany(UPSERT_PLAYER_STATS, stats_rows)
+            conn.executemany(UPSERT_PLAYER_DAILY_STATS, daily_rows)
+            # La partie est terminée : son instantané disparaît dans la même transaction
+            conn.executemany("DELETE FROM open_games WHERE message_id = ?", [(row[0],) for row in round_rows])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _rebuild_stats(self, guild_id=None):
+        # Recalcule le cumul global et le cumul quotidien de chaque joueur depuis l'historique,
+        # pour tous les serveurs ou pour le seul `guild_id`
+        conn = self._write_conn
+        where, params = ("", ()) if guild_id is None else (" WHERE guild_id = ?", (guild_id,))
+        conn.execute("DELETE FROM player_stats" + where, params)
+        conn.execute(f"INSERT INTO player_stats (guild_id, joueur_id, total_parties, total_mises, total_gagnes, victoires) SELECT * FROM ({FULL_STATS_QUERY}){where}", params)
+        conn.execute("DELETE FROM player_daily_stats" + where, params)
+        conn.execute(f"INSERT INTO player_daily_stats (guild_id, jour, joueur_id, total_parties, total_mises, total_gagnes, victoires) SELECT * FROM ({FULL_DAILY_STATS_QUERY}){where}", params)
+        conn.commit()
+        return conn.execute("SELECT COUNT(*) FROM player_stats" + where, params).fetchone()[0]
+
+    def enqueue_game(self, guild_id, game_id, montant, numbers, winners, numero_resultat, commission, gain, date):
+        """Met une partie terminée en file d'attente.
+
+        `numbers` associe chaque joueur à son numéro, `gain` est le montant reçu par chaque gagnant.
+        """
+        self._pending.append((guild_id, game_id, montant, numbers, winners, numero_resultat, commission, gain, date))
+        if self._flush_event and len(self._pending) >= self.flush_size:
+            self._flush_event.set()
+
+    @property
+    def queue_depth(self):
+        return len(self._pending)
+
+    def _bump_generation(self, guild_id):
+        self._generations[guild_id] = self._generations.get(guild_id, 0) + 1
+
+    def generation(self, guild_id):
+        """Génération des statistiques du serveur : change dès que ses cumuls sont modifiés."""
+        return self._stats_epoch, self._generations.get(guild_id, 0)
+
+    async def flush(self):
+        """Écrit toutes les parties en attente en une seule transaction. Retourne le nombre de parties écrites."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            records, self._pending = self._pending, []
+            if not records:
+                return 0
+            start = time.perf_counter()
+            try:
+                await self._write(self._log_games, records)
+            except Exception:
+                # On remet le lot en tête de file pour le retenter au prochain flush
+                self._pending[:0] = records
+                raise
+            self.last_flush_ms = (time.perf_counter() - start) * 1000
+            self.total_flush_ms += self.last_flush_ms
+            self.flush_count += 1
+            self.flushed_games += len(records)
+            for guild_id in {record[0] for record in records}:
+                self._bump_generation(guild_id)
+            return len(records)
+
+    async def _run_flusher(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print("Erreur base de données:", e)
+
+    def start_flusher(self):
+        self._stopping = False
+        self._flush_event = asyncio.Event()
+        self._flusher = asyncio.create_task(self._run_flusher())
+
+    async def stop_flusher(self):
+        if self._flusher:
+            # Arrêt par drapeau plutôt que par cancel() : wait_for peut avaler une annulation
+            # qui arrive au moment où l'événement se déclenche, et la tâche ne s'arrêterait jamais
+            self._stopping = True
+            self._flush_event.set()
+            await self._flusher
+            self._flusher = None
+        await self.flush()
+
+    async def rebuild_stats(self, guild_id=None):
+        """Reconstruit les cumuls depuis l'historique (d'un seul serveur si `guild_id` est donné). Retourne le nombre de joueurs."""
+        count = await self._write(self._rebuild_stats, guild_id)
+        if guild_id is None:
+            self._stats_epoch += 1
+        else:
+            self._bump_generation(guild_id)
+        return count
+
+    def _save_open_game(self, message_id, guild_id, channel_id, creator_id, montant, player_limit, croupier_id, players, date):
+        self._write_conn.execute("""
+        INSERT OR REPLACE INTO open_games (message_id, guild_id, channel_id, creator_id, montant, player_limit, croupier_id, players, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (message_id, guild_id, channel_id, creator_id, montant, player_limit, croupier_id, json.dumps(players), date))
+        self._write_conn.commit()
+
+    def _delete_open_game(self, message_id):
+        self._write_conn.execute("DELETE FROM open_games WHERE message_id = ?", (message_id,))
+        self._write_conn.commit()
+
+    async def save_open_game(self, message_id, guild_id, channel_id, creator_id, montant, player_limit, croupier_id, players, date):
+        """Enregistre l'état d'une partie ouverte. `players` associe chaque joueur à (numéro ou None, pseudo)."""
+        await self._write(self._save_open_game, message_id, guild_id, channel_id, creator_id, montant, player_limit, croupier_id, players, date)
+
+    async def delete_open_game(self, message_id):
+        await self._write(self._delete_open_game, message_id)
+
+    # --- CONFIGURATION DES SERVEURS ---
+    def _save_guild_config(self, guild_id, game_channels, croupier_role_id, member_role_id, commission, max_players):
+        self._write_conn.execute("""
+        INSERT OR REPLACE INTO guild_config (guild_id, game_channels, croupier_role_id, member_role_id, commission, max_players)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """, (guild_id, json.dumps(sorted(game_channels)), croupier_role_id, member_role_id, commission, max_players))
+        self._write_conn.commit()
+
+    def _adopt_legacy_history(self, guild_id):
+        # Les parties enregistrées avant la version 6 n'ont pas de serveur (guild_id = 0)
+        conn = self._write_conn
+        moved = conn.execute("UPDATE rounds SET guild_id = ? WHERE guild_id = 0", (guild_id,)).rowcount
+        if moved:
+            conn.execute("UPDATE participants SET guild_id = ? WHERE guild_id = 0", (guild_id,))
+            conn.commit()
+            self._rebuild_stats()
+        else:
+            conn.commit()
+        return moved
+
+    def _fetch_guild_configs(self):
+        rows = self._read_conn().execute("SELECT guild_id, game_channels, croupier_role_id, member_role_id, commission, max_players FROM guild_config").fetchall()
+        return [(row[0], frozenset(json.loads(row[1])), *row[2:]) for row in rows]
+
+    async def save_guild_config(self, guild_id, game_channels, croupier_role_id, member_role_id, commission, max_players):
+        await self._write(self._save_guild_config, guild_id, game_channels, croupier_role_id, member_role_id, commission, max_players)
+
+    async def fetch_guild_configs(self):
+        """Lignes (guild_id, salons de jeu, rôle croupier, rôle membre, commission, joueurs max)."""
+        return await self._read(self._fetch_guild_configs)
+
+    async def adopt_legacy_history(self, guild_id):
+        """Rattache au serveur l'historique antérieur au multi-serveur. Retourne le nombre de parties rattachées."""
+        moved = await self._write(self._adopt_legacy_history, guild_id)
+        if moved:
+            self._bump_generation(guild_id)
+        return moved
+
+    # --- LECTURES ---
+    @staticmethod
+    def _stats_source(guild_id, period):
+        # Sans période : le cumul global du serveur ; avec une période : la somme de ses cumuls quotidiens
+        if period is None:
+            return "", "player_stats", ["guild_id = ?"], (guild_id,)
+        return f"WITH fenetre AS ({WINDOW_STATS_QUERY})", "fenetre", [], (guild_id, *period)
+
+    def _fetch_leaderboard_page(self, guild_id, limit, after, before, offset, from_end, period):
+        # Tri par (total_gagnes, joueur_id) décroissants ; la clé de la ligne voisine sert de curseur
+        cte, source, conditions, source_params = self._stats_source(guild_id, period)
+        if before is not None or from_end:
+            params = ()
+            if before is not None:
+                conditions = conditions + ["(total_gagnes, joueur_id) > (?, ?)"]
+                params = before
+            where = "WHERE " + " AND ".join(conditions) if conditions else ""
+            rows = self._read_conn().execute(f"""
+            {cte}
+            SELECT joueur_id, total_parties, total_mises, total_gagnes, victoires
+            FROM {source} {where}
+            ORDER BY total_gagnes ASC, joueur_id ASC
+            LIMIT ?
+            """, (*source_params, *params, limit)).fetchall()
+            return rows[::-1]
+        params = ()
+        if after is not None:
+            conditions = conditions + ["(total_gagnes, joueur_id) < (?, ?)"]
+            params = after
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+        return self._read_conn().execute(f"""
+        {cte}
+        SELECT joueur_id, total_parties, total_mises, total_gagnes, victoires
+        FROM {source} {where}
+        ORDER BY total_gagnes DESC, joueur_id DESC
+        LIMIT ? OFFSET ?
+        """, (*source_params, *params, limit, offset)).fetchall()
+
+    def _count_players(self, guild_id, period):
+        if period is None:
+            return self._read_conn().execute("SELECT COUNT(*) FROM player_stats WHERE guild_id = ?", (guild_id,)).fetchone()[0]
+        return self._read_conn().execute("SELECT COUNT(DISTINCT joueur_id) FROM player_daily_stats WHERE guild_id = ? AND jour BETWEEN ? AND ?", (guild_id, *period)).fetchone()[0]
+
+    def _fetch_player_stats(self, guild_id, joueur_id, period):
+        if period is None:
+            return self._read_conn().execute("SELECT total_mises, total_gagnes, victoires, total_parties FROM player_stats WHERE guild_id = ? AND joueur_id = ?", (guild_id, joueur_id)).fetchone()
+        # Sans statistiques, SQLite préférerait la clé primaire (guild_id, jour) et lirait tous les joueurs de la période
+        row = self._read_conn().execute("""
+        SELECT SUM(total_mises), SUM(total_gagnes), SUM(victoires), SUM(total_parties)
+        FROM player_daily_stats INDEXED BY idx_player_daily_stats_joueur
+        WHERE guild_id = ? AND joueur_id = ? AND jour BETWEEN ? AND ?
+        """, (guild_id, joueur_id, *period)).fetchone()
+        return row if row[3] is not None else None
+
+    def _check_player_stats(self, guild_id=None):
+        conn = self._read_conn()
+        where, params = ("", ()) if guild_id is None else (" WHERE guild_id = ?", (guild_id,))
+        # Une seule transaction de lecture : les trois requêtes voient le même instantané,
+        # sans qu'un lot écrit entre elles par le flusher passe pour une incohérence
+        conn.execute("BEGIN")
+        try:
+            expected = {row[:2]: row[2:] for row in conn.execute(f"SELECT * FROM ({FULL_STATS_QUERY}){where}", params).fetchall()}
+            actual = {row[:2]: row[2:] for row in conn.execute("SELECT guild_id, joueur_id, total_parties, total_mises, total_gagnes, victoires FROM player_stats" + where, params).fetchall()}
+            # Le cumul quotidien, sommé sur toutes les dates, doit redonner le même total
+            daily = {row[:2]: row[2:] for row in conn.execute(f"""
+            SELECT guild_id, joueur_id, SUM(total_parties), SUM(total_mises), SUM(total_gagnes), SUM(victoires)
+            FROM player_daily_stats{where}
+            GROUP BY guild_id, joueur_id
+            """, params).fetchall()}
+        finally:
+            conn.execute("COMMIT")
+
+        def same(exp, act):
+            return exp is not None and act is not None and exp[0] == act[0] and exp[1] == act[1] and exp[3] == act[3] and abs(exp[2] - act[2]) <= 1e-6
+
+        return [key for key in expected.keys() | actual.keys() | daily.keys()
+                if not (same(expected.get(key), actual.get(key)) and same(daily.get(key), actual.get(key)))]
+
+    async def fetch_leaderboard_page(self, guild_id, limit, after=None, before=None, offset=0, from_end=False, period=None):
+        """Lignes (joueur_id, total_parties, total_mises, total_gagnes, victoires) du serveur, triées par gains.
+
+        `after` / `before` sont des clés (total_gagnes, joueur_id) : la page commence
+        juste après `after` ou se termine juste avant `before`. `from_end` lit la dernière page.
+        `period` est un couple de jours ("AAAA-MM-JJ", "AAAA-MM-JJ") inclus, ou None pour tout l'historique.
+        """
+        return await self._read(self._fetch_leaderboard_page, guild_id, limit, after, before, offset, from_end, period)
+
+    async def count_players(self, guild_id, period=None):
+        return await self._read(self._count_players, guild_id, period)
+
+    async def fetch_player_stats(self, guild_id, joueur_id, period=None):
+        """Ligne (total_mises, total_gagnes, victoires, total_parties) du joueur sur ce serveur, ou None."""
+        return await self._read(self._fetch_player_stats, guild_id, joueur_id, period)
+
+    def _fetch_player_history(self, guild_id, joueur_id, limit, before, after):
+        # Pagination par clé sur game_id : `before` donne les parties plus anciennes, `after` les plus récentes
+        if after is not None:
+            condition, params, order = "AND p.game_id > ?", (after,), "ASC"
+        elif before is not None:
+            condition, params, order = "AND p.game_id < ?", (before,), "DESC"
+        else:
+            condition, params, order = "", (), "DESC"
+        rows = self._read_conn().execute(f"""
+        SELECT p.game_id, r.date, p.montant, p.numero_choisi, r.numero_resultat, p.is_winner, p.gain, r.pot / r.montant
+        FROM participants p
+        JOIN rounds r ON r.game_id = p.game_id
+        WHERE p.guild_id = ? AND p.joueur_id = ? {condition}
+        ORDER BY p.game_id {order}
+        LIMIT ?
+        """, (guild_id, joueur_id, *params, limit)).fetchall()
+        return rows[::-1] if order == "ASC" else rows
+
+    def _export_history(self, path, fmt, guild_id, joueur_id):
+        # Lecture par lots, chacun dans sa propre requête : la mémoire reste bornée et aucune
+        # transaction de lecture ne reste ouverte pendant tout l'export
+        conn = self._read_conn()
+        columns = "r.game_id, r.date, r.montant, r.pot, r.commission, r.numero_resultat, r.nb_gagnants, p.joueur_id, p.numero_choisi, p.is_winner, p.gain"
+        if joueur_id is None:
+            # Clé (game_id, joueur_id) : un lot peut s'arrêter au milieu d'une partie
+            query = f"""
+            SELECT {columns}
+            FROM rounds r
+            JOIN participants p ON p.game_id = r.game_id
+            WHERE r.guild_id = ? AND r.game_id >= ? AND (r.game_id > ? OR p.joueur_id > ?)
+            ORDER BY r.game_id, p.joueur_id
+            LIMIT ?
+            """
+        else:
+            # Un joueur n'a qu'une ligne par partie : on parcourt son index d'historique
+            query = f"""
+            SELECT {columns}
+            FROM participants p
+            JOIN rounds r ON r.game_id = p.game_id
+            WHERE p.guild_id = ? AND p.joueur_id = ? AND p.game_id > ?
+            ORDER BY p.game_id
+            LIMIT ?
+            """
+        last_game, last_player = -1, -1
+        count = 0
+        with gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=6) as out:
+            writer = csv.writer(out) if fmt == "csv" else None
+            if writer:
+                writer.writerow(EXPORT_COLUMNS)
+            while True:
+                if joueur_id is None:
+                    params = (guild_id, last_game, last_game, last_player, EXPORT_CHUNK)
+                else:
+                    params = (guild_id, joueur_id, last_game, EXPORT_CHUNK)
+                rows = conn.execute(query, params).fetchall()
+                if not rows:
+                    return count
+                if writer:
+                    writer.writerows(rows)
+                else:
+                    out.writelines(json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + "\n" for row in rows)
+                count += len(rows)
+                last_game, last_player = rows[-1][0], rows[-1][7]
+
+    async def fetch_player_history(self, guild_id, joueur_id, limit, before=None, after=None):
+        """Parties du joueur, de la plus récente à la plus ancienne.
+
+        Lignes (game_id, date, montant, numero_choisi, numero_resultat, is_winner, gain, nb_joueurs).
+        """
+        return await self._read(self._fetch_player_history, guild_id, joueur_id, limit, before, after)
+
+    async def export_history(self, path, fmt, guild_id, joueur_id=None):
+        """Écrit l'historique du serveur (ou d'un joueur) dans `path`, en CSV ou JSON Lines compressé. Retourne le nombre de lignes."""
+        return await self._read(self._export_history, path, fmt, guild_id, joueur_id)
+
+    def _fetch_open_games(self):
+        rows = self._read_conn().execute("SELECT message_id, guild_id, channel_id, creator_id, montant, player_limit, croupier_id, players FROM open_games").fetchall()
+        games = []
+        for row in rows:
+            # Les clés JSON sont des chaînes : on retrouve les identifiants entiers.
+            # Les instantanés plus anciens ne contiennent que le numéro, sans pseudo.
+            players = {}
+            for user_id, value in json.loads(row[7]).items():
+                players[int(user_id)] = tuple(value) if isinstance(value, list) else (value, None)
+            games.append(row[:7] + (players,))
+        return games
+
+    async def fetch_open_games(self):
+        """Lignes (message_id, guild_id, channel_id, creator_id, montant, player_limit, croupier_id, players).
+
+        `guild_id` vaut None pour les instantanés enregistrés avant la version 7.
+        """
+        return await self._read(self._fetch_open_games)
+
+    async def check_player_stats(self, guild_id=None):
+        """Liste des couples (guild_id, joueur_id) dont le cumul diffère de l'agrégation complète."""
+        return await self._read(self._check_player_stats, guild_id)
+
+    # --- ÉCRIVAIN PARTAGÉ ---
+    def _serve_client(self, conn):
+        with conn:
+            while True:
+                try:
+                    name, args = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if name not in REMOTE_WRITES:
+                        raise ValueError(f"Écriture inconnue : {name}")
+                    # Toutes les écritures, locales ou distantes, passent par le même thread et la même connexion
+                    conn.send((True, self._writer.submit(getattr(self, name), *args).result()))
+                except Exception as e:
+                    # L'exception d'origine n'est pas forcément sérialisable : on n'en renvoie que le texte
+                    conn.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
+
+    def serve(self, address, key):
+        """Accepte les écritures des autres processus. Retourne le Listener (son adresse réelle est `.address`)."""
+        listener = Listener(address, authkey=key)
+
+        def accept():
+            while True:
+                try:
+                    conn = listener.accept()
+                except AuthenticationError:
+                    continue
+                except OSError:
+                    return
+                threading.Thread(target=self._serve_client, args=(conn,), daemon=True).start()
+
+        threading.Thread(target=accept, name="db-writer-server", daemon=True).start()
+        return listener
+
+    def close(self):
+        self._readers.shutdown(wait=True)
+        for conn in self._read_conns:
+            conn.close()
+        self._writer.submit((self._writer_client or self._write_conn).close).result()
+        self._writer.shutdown(wait=True)
@@ -0,0 +1,121 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Limiteur simple : `capacity` jetons, rechargés à `rate` jetons par seconde."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def _freeze(value):
+    # Représentation figée d'un argument d'édition, pour détecter les éditions sans effet
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if hasattr(value, "to_dict"):
+        return repr(value.to_dict())
+    if hasattr(value, "to_components"):
+        return repr(value.to_components())
+    return repr(value)
+
+
+class EditScheduler:
+    """Regroupe les éditions de messages pour ménager la limite d'éditions par salon.
+
+    Pour chaque message, seule la dernière version demandée est envoyée (les versions
+    intermédiaires sont fusionnées), les éditions identiques à l'état déjà affiché sont
+    ignorées, et chaque salon dispose de son propre seau de jetons.
+    """
+
+    def __init__(self, rate=1.0, capacity=5):
+        self.rate = rate
+        self.capacity = capacity
+        self._buckets = {}
+        self._pending = {}
+        self._tasks = {}
+        self._last = {}
+        self.sent = 0
+        self.coalesced = 0
+        self.skipped = 0
+
+    def _bucket(self, channel_id):
+        bucket = self._buckets.get(channel_id)
+        if bucket is None:
+            bucket = self._buckets[channel_id] = TokenBucket(self.rate, self.capacity)
+        return bucket
+
+    @staticmethod
+    def _signature(kwargs):
+        return tuple(sorted((key, _freeze(value)) for key, value in kwargs.items()))
+
+    def remember(self, message, **kwargs):
+        """Enregistre l'état d'un message tout juste envoyé, pour ignorer une édition identique."""
+        self._last[message.id] = self._signature(kwargs)
+
+    def forget(self, message_id):
+        self._last.pop(message_id, None)
+
+    def submit(self, message, **kwargs):
+        """Programme une édition sans l'attendre. Retourne un future résolu une fois l'état affiché."""
+        key = message.id
+        if key in self._pending:
+            previous, future = self._pending[key]
+            kwargs = {**previous, **kwargs}
+            self.coalesced += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+        self._pending[key] = (kwargs, future)
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._run(message))
+        return future
+
+    async def edit(self, message, **kwargs):
+        await self.submit(message, **kwargs)
+
+    async def _run(self, message):
+        key = message.id
+        bucket = self._bucket(message.channel.id)
+        try:
+            while key in self._pending:
+                kwargs, future = self._pending[key]
+                if self._signature(kwargs) != self._last.get(key):
+                    await bucket.acquire()
+                # La dernière version demandée pendant l'attente l'emporte
+                kwargs, future = self._pending.pop(key)
+                signature = self._signature(kwargs)
+                if signature == self._last.get(key):
+                    self.skipped += 1
+                    future.set_result(None)
+                    continue
+                try:
+                    await message.edit(**kwargs)
+                except Exception as e:
+                    print("Erreur lors de l'édition du message:", e)
+                    future.set_exception(e)
+                    # Déjà affichée : les futures de submit() ne sont pas toujours attendus, on marque
+                    # l'exception comme lue pour éviter "Future exception was never retrieved".
+                    # edit(), qui attend le future, la relève toujours.
+                    future.exception()
+                    continue
+                self._last[key] = signature
+                self.sent += 1
+                future.set_result(None)
+        finally:
+            self._tasks.pop(key, None)
@@ -0,0 +1,152 @@
+import asyncio
+import random
+from dataclasses import dataclass, field
+
+
+@dataclass(slots=True)
+class Participant:
+    """Joueur inscrit : seul son identifiant est gardé, l'utilisateur Discord n'est pas retenu."""
+    user_id: int
+    display_name: str
+    number: int = None
+
+    @property
+    def mention(self):
+        return f"<@{self.user_id}>"
+
+
+@dataclass(slots=True)
+class Game:
+    """État d'une partie ouverte ; `players` associe chaque identifiant à son Participant."""
+    guild_id: int
+    channel_id: int
+    creator_id: int
+    montant: int
+    player_limit: int
+    players: dict = field(default_factory=dict)
+    croupier_id: int = None
+    started: bool = False
+
+    @property
+    def numbers(self):
+        return {user_id: participant.number for user_id, participant in self.players.items()}
+
+
+class GameRegistry:
+    """Registre des parties en cours.
+
+    La Game de chaque partie est la seule source de vérité ; l'index joueur -> partie permet de vérifier en temps constant si un
+    joueur est déjà inscrit ailleurs, et chaque partie a son propre verrou pour que
+    deux clics simultanés ne s'entrelacent pas. L'index est cloisonné par serveur :
+    un joueur peut avoir une partie en cours sur chacun des serveurs du bot. Les parties
+    sont aussi regroupées par serveur, ce qui permet à un shard de retirer celles d'un
+    serveur qu'il ne sert plus.
+    """
+
+    def __init__(self):
+        self._games = {}
+        self._guild_games = {}
+        self._player_index = {}
+        self._locks = {}
+
+    def __contains__(self, message_id):
+        return message_id in self._games
+
+    def __len__(self):
+        return len(self._games)
+
+    def get(self, message_id):
+        return self._games.get(message_id)
+
+    def items(self):
+        return self._games.items()
+
+    def guild_games(self, guild_id):
+        """Identifiants des parties ouvertes sur ce serveur."""
+        return list(self._guild_games.get(guild_id, ()))
+
+    def lock(self, message_id):
+        lock = self._locks.get(message_id)
+        if lock is None:
+            lock = self._locks[message_id] = asyncio.Lock()
+        return lock
+
+    # --- JOUEURS ---
+    def is_playing(self, guild_id, user_id):
+        return (guild_id, user_id) in self._player_index
+
+    def game_of(self, guild_id, user_id):
+        """Identifiant de la partie du joueur sur ce serveur (None si la partie n'est pas encore publiée)."""
+        return self._player_index.get((guild_id, user_id))
+
+    def reserve(self, guild_id, user_id):
+        """Réserve un joueur avant la création du message de la partie. Retourne False s'il joue déjà."""
+        key = (guild_id, user_id)
+        if key in self._player_index:
+            return False
+        self._player_index[key] = None
+        return True
+
+    def release(self, guild_id, user_id):
+        key = (guild_id, user_id)
+        if key in self._player_index and self._player_index[key] is None:
+            del self._player_index[key]
+
+    def add_player(self, message_id, participant):
+        game = self._games[message_id]
+        game.players[participant.user_id] = participant
+        self._player_index[game.guild_id, participant.user_id] = message_id
+
+    def remove_player(self, message_id, user_id):
+        game = self._games[message_id]
+        game.players.pop(user_id, None)
+        key = (game.guild_id, user_id)
+        if self._player_index.get(key) == message_id:
+            del self._player_index[key]
+
+    # --- PARTIES ---
+    def add(self, message_id, game):
+        self._games[message_id] = game
+        self._guild_games.setdefault(game.guild_id, set()).add(message_id)
+        for user_id in game.players:
+            self._player_index[game.guild_id, user_id] = message_id
+
+    def remove(self, message_id):
+        game = self._games.pop(message_id, None)
+        self._locks.pop(message_id, None)
+        if game:
+            guild_games = self._guild_games.get(game.guild_id)
+            if guild_games is not None:
+                guild_games.discard(message_id)
+                if not guild_games:
+                    del self._guild_games[game.guild_id]
+            for user_id in game.players:
+                key = (game.guild_id, user_id)
+                if self._player_index.get(key) == message_id:
+                    del self._player_index[key]
+        return game
+
+    def remove_guild(self, guild_id):
+        """Retire toutes les parties d'un serveur, ainsi que les réservations de ses joueurs."""
+        removed = [message_id for message_id in self.guild_games(guild_id) if self.remove(message_id)]
+        for key in [key for key in self._player_index if key[0] == guild_id]:
+            del self._player_index[key]
+        return removed
+
+
+# --- TIRAGE ---
+def draw_winning_number(chosen_numbers, max_missed=0, rng=random):
+    """Tire directement le numéro gagnant parmi les numéros choisis.
+
+    Relancer un dé à 6 faces jusqu'à tomber sur un numéro choisi donne un résultat
+    uniforme parmi ces numéros : un seul tirage suffit. Le nombre de lancers ratés
+    suit une loi géométrique de paramètre k/6 ; on en renvoie au plus `max_missed`
+    (numéros non choisis) pour rejouer une courte animation.
+    """
+    chosen = sorted(set(chosen_numbers))
+    missing = [n for n in range(1, 7) if n not in chosen]
+    hit_probability = len(chosen) / 6
+    missed = []
+    while missing and len(missed) < max_missed and rng.random() >= hit_probability:
+        missed.append(rng.choice(missing))
+    return rng.choice(chosen), missed
@@ -0,0 +1,52 @@
+import dataclasses
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True, slots=True)
+class GuildConfig:
+    """Configuration d'un serveur. Sans salon de jeu, les commandes de jeu y sont refusées."""
+    guild_id: int
+    game_channels: frozenset = frozenset()
+    croupier_role_id: int = None
+    member_role_id: int = None
+    commission: float = 0.05
+    max_players: int = 6
+
+    @property
+    def member_mention(self):
+        # Mention construite à partir de l'identifiant : pas besoin de relire le rôle à chaque partie
+        return f"<@&{self.member_role_id}>" if self.member_role_id else ""
+
+    def channel_mentions(self):
+        return ", ".join(f"<#{channel_id}>" for channel_id in sorted(self.game_channels))
+
+
+class GuildConfigs:
+    """Configurations des serveurs, chargées une fois au démarrage puis servies depuis la mémoire.
+
+    Une modification est d'abord écrite dans la base, puis remplace la configuration en cache.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._configs = {}
+
+    def __contains__(self, guild_id):
+        return guild_id in self._configs
+
+    def __len__(self):
+        return len(self._configs)
+
+    async def load(self):
+        self._configs = {row[0]: GuildConfig(*row) for row in await self.db.fetch_guild_configs()}
+        return len(self._configs)
+
+    def get(self, guild_id):
+        config = self._configs.get(guild_id)
+        return config if config is not None else GuildConfig(guild_id)
+
+    async def update(self, guild_id, **changes):
+        config = dataclasses.replace(self.get(guild_id), **changes)
+        await self.db.save_guild_config(*dataclasses.astuple(config))
+        self._configs[guild_id] = config
+        return config
@@ -1,18 +1,37 @@
-from flask import Flask
-from threading import Thread
+import discord
+from aiohttp import web
 
-app = Flask('')
+from metrics import collector
 
+BOT_KEY = web.AppKey("bot", discord.Client)
 
-@app.route('/')
-def home():
-  return "le bot est en ligne jeux de numéro mystere !"
 
+async def home(request):
+  return web.Response(text="le bot est en ligne jeux de numéro mystere !")
 
-def run():
-  app.run(host='0.0.0.0', port=8088)
 
+async def ready(request):
+  # Prêt uniquement si toutes les connexions à la passerelle Discord sont établies :
+  # is_ready() ne redevient faux qu'à l'arrêt, pas pendant une déconnexion ou une reprise
+  bot = request.app[BOT_KEY]
+  if bot.is_ready() and not bot.is_closed() and not bot.disconnected_shards:
+    return web.Response(text="ok")
+  return web.Response(text="not ready", status=503)
 
-def keep_alive():
-  t = Thread(target=run)
-  t.start()
+
+async def metrics(request):
+  return web.Response(text=collector.render(), content_type="text/plain; version=0.0.4")
+
+
+async def keep_alive(bot, host='0.0.0.0', port=8088):
+  """Démarre le serveur HTTP sur la boucle du bot. Retourne le runner à arrêter avec `cleanup()`."""
+  app = web.Application()
+  app[BOT_KEY] = bot
+  app.router.add_get('/', home)
+  app.router.add_get('/ready', ready)
+  app.router.add_get('/metrics', metrics)
+
+  runner = web.AppRunner(app, access_log=None)
+  await runner.setup()
+  await web.TCPSite(runner, host, port).start()
+  return runner
@@ -0,0 +1,107 @@
+import asyncio
+from collections import OrderedDict
+
+
+class LeaderboardPages:
+    """Pages du classement, chargées à la demande.
+
+    Chaque page est lue par pagination par clé (`total_gagnes`, `joueur_id`) à partir
+    des bornes d'une page voisine déjà chargée, ce qui garde un coût constant quel que
+    soit le nombre de joueurs. Les pages (lignes et embed rendu) sont conservées en LRU
+    et restent valides tant que la génération des statistiques du serveur ne change pas.
+    Chaque serveur a son propre classement ; `period` vaut None pour tout l'historique,
+    ou un couple de jours inclus.
+    """
+
+    def __init__(self, db, per_page=10, max_pages=32):
+        self.db = db
+        self.per_page = per_page
+        self.max_pages = max_pages
+        # Par serveur : génération connue, nombre de joueurs et bornes des pages par période
+        self._generations = {}
+        self._counts = {}
+        self._bounds = {}
+        self._pages = OrderedDict()
+        self._inflight = {}
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def max_page(self, guild_id, period=None):
+        return max(self._counts.get(guild_id, {}).get(period, 0) - 1, 0) // self.per_page
+
+    async def open(self, guild_id, period=None):
+        """Retourne (génération, nombre de joueurs) ; ne recompte que si des parties ont été enregistrées."""
+        async with self._lock:
+            generation = self.db.generation(guild_id)
+            if self._generations.get(guild_id) != generation:
+                # Génération lue avant la requête : une écriture concurrente provoquera une relecture
+                self._generations[guild_id] = generation
+                self._counts[guild_id] = {}
+                self._bounds[guild_id] = {}
+            counts = self._counts[guild_id]
+            if period not in counts:
+                counts[period] = await self.db.count_players(guild_id, period)
+            return generation, counts[period]
+
+    async def _fetch(self, guild_id, period, page):
+        limit = self.per_page
+        bounds = self._bounds[guild_id]
+        if page == 0:
+            rows = await self.db.fetch_leaderboard_page(guild_id, limit, period=period)
+        elif (period, page - 1) in bounds:
+            rows = await self.db.fetch_leaderboard_page(guild_id, limit, after=bounds[period, page - 1][1], period=period)
+        elif (period, page + 1) in bounds:
+            rows = await self.db.fetch_leaderboard_page(guild_id, limit, before=bounds[period, page + 1][0], period=period)
+        elif page == self.max_page(guild_id, period):
+            rows = await self.db.fetch_leaderboard_page(guild_id, self._counts[guild_id][period] - page * limit, from_end=True, period=period)
+        else:
+            # Saut direct vers une page dont aucune voisine n'est connue : seul cas avec un OFFSET
+            rows = await self.db.fetch_leaderboard_page(guild_id, limit, offset=page * limit, period=period)
+
+        if rows:
+            bounds[period, page] = ((rows[0][3], rows[0][0]), (rows[-1][3], rows[-1][0]))
+        entries = []
+        for user_id, total_parties, total_mises, total_gagnes, victoires in rows:
+            winrate = (victoires / total_parties * 100) if total_parties > 0 else 0.0
+            entries.append((user_id, total_parties, total_mises, total_gagnes, victoires, winrate))
+        return entries
+
+    async def _load(self, generation, guild_id, period, page):
+        key = (generation, guild_id, period, page)
+        entry = self._pages.get(key)
+        if entry is not None:
+            self._pages.move_to_end(key)
+            self.hits += 1
+            return entry
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = self._inflight[key] = asyncio.create_task(self._fetch(guild_id, period, page))
+        try:
+            entries = await task
+        finally:
+            self._inflight.pop(key, None)
+        entry = self._pages.get(key)
+        if entry is None:
+            # Lignes de la page et embeds rendus, par titre : deux périodes peuvent avoir les mêmes dates
+            entry = self._pages[key] = (entries, {})
+            if len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+        return entry
+
+    async def page(self, generation, guild_id, page, render, period=None, label=None):
+        """Embed de la page demandée ; `render(entries)` n'est appelé que si la page n'est pas déjà rendue sous ce titre.
+
+        `label` est le nom de la période affiché dans le titre : "Aujourd'hui" et "Cette semaine"
+        peuvent couvrir les mêmes jours et partager les mêmes lignes, pas le même embed.
+        """
+        entries, rendered = await self._load(generation, guild_id, period, page)
+        if label not in rendered:
+            rendered[label] = render(entries)
+        return rendered[label]
+
+    def prefetch(self, generation, guild_id, page, period=None):
+        """Charge la page en arrière-plan pour que le prochain clic soit servi depuis la mémoire."""
+        if 0 <= page <= self.max_page(guild_id, period) and (generation, guild_id, period, page) not in self._pages:
+            asyncio.create_task(self._load(generation, guild_id, period, page))
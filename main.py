@@ -1,24 +1,87 @@
 import os
+import functools
 import discord
 from discord import app_commands
 from discord.ext import commands
 from keep_alive import keep_alive
+from database import Database
+from games import Game, GameRegistry, Participant, draw_winning_number
+from edits import EditScheduler
+from metrics import collector
+from leaderboard import LeaderboardPages
+from guilds import GuildConfigs
 import random
+import signal
 import asyncio
-import sqlite3
-from datetime import datetime
-
-# --- TOKEN ET INTENTS ---
-token = os.environ['TOKEN_BOT_DISCORD']
+from datetime import date, datetime, timedelta, timezone
 
+# --- CONFIGURATION ET INTENTS ---
+# Configuration de l'installation d'origine (un seul serveur) : elle devient celle de ce serveur
+# au premier démarrage, les autres serveurs se configurent avec /config
 ID_CROUPIER = 1406210029815861258
 ID_MEMBRE = 1406210131515019355
 ID_SALON_JEU = 1406567709956898837
 
+# --- TIRAGE ---
+# "direct" : le numéro gagnant est tiré en une fois parmi les numéros choisis (même loi que les relances)
+# "relance" : le dé est relancé jusqu'à tomber sur un numéro choisi
+MODE_TIRAGE = os.environ.get("MODE_TIRAGE", "direct")
+RELANCES_ANIMEES_MAX = 2
+
+# Dossier des exports de l'historique (/export)
+EXPORT_DIR = os.environ.get("EXPORT_DIR", "exports")
+
+# --- SHARDS ---
+# SHARDING=auto : un seul processus, autant de connexions à la passerelle que Discord le recommande.
+# SHARD_COUNT / SHARD_IDS : ce processus ne sert que les shards listés (voir shards.py pour lancer
+# plusieurs processus sur la même machine). Sans ces variables, une seule connexion comme avant.
+SHARD_COUNT = int(os.environ["SHARD_COUNT"]) if os.environ.get("SHARD_COUNT") else None
+SHARD_IDS = [int(shard_id) for shard_id in os.environ["SHARD_IDS"].split(",")] if os.environ.get("SHARD_IDS") else None
+SHARDED = os.environ.get("SHARDING") == "auto" or SHARD_COUNT is not None
+if SHARD_IDS is not None and SHARD_COUNT is None:
+    raise RuntimeError("SHARD_IDS nécessite SHARD_COUNT.")
+
 intents = discord.Intents.default()
-bot = commands.Bot(command_prefix="/", intents=intents)
 
-active_games = {}
+class NumeroMystereBot(commands.AutoShardedBot if SHARDED else commands.Bot):
+    games_restored = False
+    web_runner = None
+
+    async def setup_hook(self):
+        # Connexions à la passerelle actuellement coupées (identifiant de shard, 0 sans shards)
+        self.disconnected_shards = set()
+        db.start_flusher()
+        await guild_configs.load()
+        self.web_runner = await keep_alive(self, port=int(os.environ.get("PORT", 8088)))
+        # Client.run ne gère que Ctrl-C : sous docker stop, systemd ou un recyclage de l'hébergeur,
+        # SIGTERM doit aussi passer par close() pour écrire les parties encore en file d'attente
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(self.close()))
+        except NotImplementedError:
+            pass
+
+    async def close(self):
+        try:
+            if self.web_runner:
+                runner, self.web_runner = self.web_runner, None
+                await runner.cleanup()
+            # Écrit les instantanés et les parties encore en file d'attente avant de couper la connexion
+            await asyncio.gather(*snapshot_tasks.values())
+            await db.stop_flusher()
+        finally:
+            await super().close()
+
+shard_options = {"shard_count": SHARD_COUNT, "shard_ids": SHARD_IDS} if SHARDED else {}
+bot = NumeroMystereBot(command_prefix="/", intents=intents, **shard_options)
+
+def owns_guild(guild_id):
+    """Vrai si le serveur est servi par l'une des connexions de ce processus."""
+    if not SHARDED or SHARD_IDS is None:
+        return True
+    return (guild_id >> 22) % SHARD_COUNT in SHARD_IDS
+
+active_games = GameRegistry()
+edit_scheduler = EditScheduler()
 
 # --- ÉMOJIS ---
 EMOJI_MAPPING = {
@@ -31,30 +94,96 @@ EMOJI_MAPPING = {
 }
 
 # --- CONNEXION À LA BASE DE DONNÉES ---
-conn = sqlite3.connect("game_stats.db")
-c = conn.cursor()
-c.execute("""
-CREATE TABLE IF NOT EXISTS games (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    game_id INTEGER NOT NULL,
-    joueur_id INTEGER NOT NULL,
-    montant INTEGER NOT NULL,
-    numero_choisi INTEGER NOT NULL,
-    gagnant_id INTEGER,
-    numero_resultat INTEGER,
-    date TIMESTAMP NOT NULL
+# GAME_STATS_WRITER ("hôte:port") : les écritures sont confiées au processus écrivain lancé par shards.py
+writer_host, _, writer_port = os.environ.get("GAME_STATS_WRITER", "").partition(":")
+db = Database(
+    os.environ.get("GAME_STATS_DB", "game_stats.db"),
+    writer_address=(writer_host, int(writer_port)) if writer_port else None,
+    writer_key=bytes.fromhex(os.environ.get("GAME_STATS_WRITER_KEY", "")) or None
 )
-""")
-conn.commit()
+leaderboard = LeaderboardPages(db)
+guild_configs = GuildConfigs(db)
+
+# --- MÉTRIQUES ---
+collector.register("numero_db_queue_depth", lambda: db.queue_depth)
+collector.register("numero_db_flushes_total", lambda: db.flush_count, kind="counter")
+collector.register("numero_db_flushed_games_total", lambda: db.flushed_games, kind="counter")
+collector.register("numero_edits_sent_total", lambda: edit_scheduler.sent, kind="counter")
+collector.register("numero_edits_coalesced_total", lambda: edit_scheduler.coalesced, kind="counter")
+collector.register("numero_edits_skipped_total", lambda: edit_scheduler.skipped, kind="counter")
+collector.register("numero_active_games", lambda: len(active_games))
+collector.register("numero_configured_guilds", lambda: len(guild_configs))
+collector.register("numero_guilds", lambda: len(bot.guilds))
+collector.register("numero_gateway_latency_seconds", lambda: bot.latency)
+collector.register("numero_leaderboard_cache_hits_total", lambda: leaderboard.hits, kind="counter")
+collector.register("numero_leaderboard_cache_misses_total", lambda: leaderboard.misses, kind="counter")
+
+class TimedResponse:
+    """Enveloppe `interaction.response` : mesure le délai entre l'interaction et son accusé de réception.
+
+    Discord n'accepte qu'une réponse par interaction : la première qui aboutit est l'accusé de réception.
+    """
+
+    def __init__(self, response, interaction, handler):
+        self._response = response
+        self._interaction = interaction
+        self._handler = handler
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def _acknowledged(self):
+        delay = (discord.utils.utcnow() - self._interaction.created_at).total_seconds()
+        collector.observe("numero_interaction_ack_seconds", delay, handler=self._handler)
+
+    async def defer(self, *args, **kwargs):
+        result = await self._response.defer(*args, **kwargs)
+        self._acknowledged()
+        return result
+
+    async def send_message(self, *args, **kwargs):
+        result = await self._response.send_message(*args, **kwargs)
+        self._acknowledged()
+        return result
+
+    async def edit_message(self, *args, **kwargs):
+        result = await self._response.edit_message(*args, **kwargs)
+        self._acknowledged()
+        return result
+
+    async def send_modal(self, *args, **kwargs):
+        result = await self._response.send_modal(*args, **kwargs)
+        self._acknowledged()
+        return result
+
+def instrumented(name):
+    """Mesure la durée d'un callback et le délai entre l'interaction et sa réponse."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            interaction = next(arg for arg in args if isinstance(arg, discord.Interaction))
+            collector.inc("numero_interactions_total", handler=name)
+            # Le délai est relevé dès l'envoi de la réponse, pas à la fin du callback
+            # (la suite du tirage ou l'instantané de la partie n'en font pas partie)
+            interaction._cs_response = TimedResponse(interaction.response, interaction, name)
+            with collector.timer("numero_handler_seconds", handler=name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
 
 @bot.tree.error
 async def on_app_command_error(interaction: discord.Interaction, error):
     if isinstance(error, app_commands.CheckFailure):
         await interaction.response.send_message("❌ Tu n'as pas la permission d'utiliser cette commande.", ephemeral=True)
 
-async def end_game(interaction: discord.Interaction, game_data, original_message):
-    montant = game_data["montant"]
-    players = game_data["players"]
+async def end_game(interaction: discord.Interaction, game, original_message):
+    with collector.timer("numero_end_game_seconds"):
+        await _end_game(interaction, game, original_message)
+    collector.inc("numero_games_finished_total")
+
+async def _end_game(interaction: discord.Interaction, game, original_message):
+    montant = game.montant
+    players = game.players
 
     suspense_embed = discord.Embed(
         title="🎲 Tirage en cours...",
@@ -64,25 +193,43 @@ async def end_game(interaction: discord.Interaction, game_data, original_message
     suspense_embed.set_image(url="https://images.emojiterra.com/google/noto-emoji/animated-emoji/1f3b2.gif")
     
     countdown_message = await interaction.channel.send(embed=suspense_embed)
+    edit_scheduler.remember(countdown_message, embed=suspense_embed)
+
+    if MODE_TIRAGE == "direct":
+        mystery_number, missed_rolls = draw_winning_number([participant.number for participant in players.values()], RELANCES_ANIMEES_MAX)
 
-    while True:
         for i in range(5, 0, -1):
             suspense_embed.description = f"On croise les doigts 🤞🏻 !"
-            await countdown_message.edit(embed=suspense_embed)
+            edit_scheduler.submit(countdown_message, embed=suspense_embed)
             await asyncio.sleep(1)
 
-        mystery_number = random.randint(1, 6)
-        winners = [player_id for player_id, data in players.items() if data['number'] == mystery_number]
-        
-        if winners:
-            break
-        
-        suspense_embed.description = f"Le numéro tiré est **{EMOJI_MAPPING[mystery_number]}**.Pas de gagnant . Relance du dé !"
-        await countdown_message.edit(embed=suspense_embed)
-        await asyncio.sleep(4)
+        # Courte animation des lancers ratés, bornée par RELANCES_ANIMEES_MAX
+        for missed_number in missed_rolls:
+            suspense_embed.description = f"Le numéro tiré est **{EMOJI_MAPPING[missed_number]}**.Pas de gagnant . Relance du dé !"
+            edit_scheduler.submit(countdown_message, embed=suspense_embed)
+            await asyncio.sleep(2)
+
+        winners = [player_id for player_id, participant in players.items() if participant.number == mystery_number]
+    else:
+        while True:
+            for i in range(5, 0, -1):
+                suspense_embed.description = f"On croise les doigts 🤞🏻 !"
+                edit_scheduler.submit(countdown_message, embed=suspense_embed)
+                await asyncio.sleep(1)
 
+            mystery_number = random.randint(1, 6)
+            winners = [player_id for player_id, participant in players.items() if participant.number == mystery_number]
+            
+            if winners:
+                break
+            
+            suspense_embed.description = f"Le numéro tiré est **{EMOJI_MAPPING[mystery_number]}**.Pas de gagnant . Relance du dé !"
+            edit_scheduler.submit(countdown_message, embed=suspense_embed)
+            await asyncio.sleep(4)
+
+    config = guild_configs.get(game.guild_id)
     total_pot = montant * len(players)
-    commission_montant = int(total_pot * 0.05)
+    commission_montant = int(total_pot * config.commission)
     net_pot = total_pot - commission_montant
     
     win_per_person = net_pot // len(winners) if len(winners) > 0 else 0
@@ -91,52 +238,107 @@ async def end_game(interaction: discord.Interaction, game_data, original_message
     result_embed.add_field(name="Le Numéro Mystère est :", value=f"**{EMOJI_MAPPING[mystery_number]}** ", inline=False)
     result_embed.add_field(name=" ", value="─" * 20, inline=False)
 
-    for player_id, data in players.items():
-        user = data['user']
-        number = data['number']
+    for player_id, participant in players.items():
         is_winner = player_id in winners
         
         status_emoji = "✅" if is_winner else "❌"
         status_text = f"**Gagné !**" if is_winner else "**Perdu**"
         
-        result_embed.add_field(name=f"{status_emoji} {user.display_name}", 
-                                value=f"A choisi : **{EMOJI_MAPPING[number]}** | {status_text}", 
+        result_embed.add_field(name=f"{status_emoji} {participant.display_name}", 
+                                value=f"A choisi : **{EMOJI_MAPPING[participant.number]}** | {status_text}", 
                                 inline=False)
 
     result_embed.add_field(name=" ", value="─" * 20, inline=False)
     result_embed.add_field(name="💰 Montant Total Misé", value=f"**{format(total_pot, ',').replace(',', ' ')}** kamas", inline=True)
-    result_embed.add_field(name="💸 Commission (5%)", value=f"**{format(commission_montant, ',').replace(',', ' ')}** kamas", inline=True)
+    result_embed.add_field(name=f"💸 Commission ({config.commission * 100:g}%)", value=f"**{format(commission_montant, ',').replace(',', ' ')}** kamas", inline=True)
     result_embed.add_field(name=" ", value="─" * 20, inline=False)
     
     if len(winners) == 1:
-        winner_user = None
-        try:
-            winner_user = await bot.fetch_user(winners[0])
-        except discord.NotFound:
-            pass
-        
-        if winner_user:
-            result_embed.add_field(name="🏆 Gagnant", value=f"{winner_user.mention} remporte **{format(win_per_person, ',').replace(',', ' ')}** kamas !", inline=False)
-        else:
-            result_embed.add_field(name="🏆 Gagnant", value=f"<@{winners[0]}> remporte **{format(win_per_person, ',').replace(',', ' ')}** kamas ! (Utilisateur introuvable)", inline=False)
+        result_embed.add_field(name="🏆 Gagnant", value=f"{players[winners[0]].mention} remporte **{format(win_per_person, ',').replace(',', ' ')}** kamas !", inline=False)
     elif len(winners) > 1:
         mentions = " ".join([f"<@{w_id}>" for w_id in winners])
         result_embed.add_field(name="🏆 Gagnants (Égalité)", value=f"{mentions} se partagent le gain et reçoivent **{format(win_per_person, ',').replace(',', ' ')}** kamas chacun.", inline=False)
     
-    await countdown_message.edit(embed=result_embed, view=None)
-    await original_message.delete()
+    # Affichage du résultat et suppression du lobby sont indépendants : envoyés en parallèle
+    await asyncio.gather(
+        edit_scheduler.edit(countdown_message, embed=result_embed, view=None),
+        original_message.delete()
+    )
+    edit_scheduler.forget(countdown_message.id)
     
     now = datetime.utcnow()
+    db.enqueue_game(game.guild_id, original_message.id, montant, game.numbers, winners, mystery_number, commission_montant, win_per_person, now)
+
+    active_games.remove(original_message.id)
+    edit_scheduler.forget(original_message.id)
+
+# --- SAUVEGARDE DES PARTIES OUVERTES ---
+# L'état est copié sous le verrou de la partie, mais écrit après : un clic n'attend jamais
+# l'écrivain (occupé par un lot ou par /rebuildstats). Pour chaque partie, les écritures
+# se suivent dans l'ordre et seul le dernier état en attente est écrit.
+pending_snapshots = {}
+snapshot_tasks = {}
+
+def save_game_snapshot(message_id):
+    """Copie l'état actuel de la partie et programme son écriture."""
+    game = active_games.get(message_id)
+    if not game:
+        return
+    players = {user_id: (participant.number, participant.display_name) for user_id, participant in game.players.items()}
+    pending_snapshots[message_id] = (message_id, game.guild_id, game.channel_id, game.creator_id, game.montant, game.player_limit, game.croupier_id, players)
+    if message_id not in snapshot_tasks:
+        snapshot_tasks[message_id] = asyncio.create_task(write_game_snapshots(message_id))
+
+async def write_game_snapshots(message_id):
     try:
-        for player_id, data in players.items():
-            winner_to_log = winners[0] if winners else None
-            c.execute("INSERT INTO games (game_id, joueur_id, montant, numero_choisi, gagnant_id, numero_resultat, date) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                        (original_message.id, player_id, montant, data['number'], winner_to_log, mystery_number, now))
-        conn.commit()
-    except Exception as e:
-        print("Erreur base de données:", e)
+        while message_id in pending_snapshots:
+            snapshot = pending_snapshots.pop(message_id)
+            # Partie terminée ou annulée entre-temps : son instantané est supprimé, il ne doit pas réapparaître.
+            # Sinon l'écriture part tout de suite vers l'écrivain, avant toute suppression demandée ensuite
+            if message_id not in active_games:
+                continue
+            try:
+                await db.save_open_game(*snapshot, datetime.utcnow())
+            except Exception as e:
+                print("Erreur base de données:", e)
+    finally:
+        snapshot_tasks.pop(message_id, None)
 
-    active_games.pop(original_message.id, None)
+async def restore_open_games():
+    restored = 0
+    for message_id, guild_id, channel_id, creator_id, montant, player_limit, croupier_id, players in await db.fetch_open_games():
+        # Chaque processus ne reprend que les parties des serveurs de ses shards
+        if guild_id is not None and not owns_guild(guild_id):
+            continue
+        channel = bot.get_channel(channel_id)
+        if channel is None:
+            # Ancien instantané sans serveur : il appartient peut-être à un autre processus
+            if guild_id is None and SHARD_IDS is not None:
+                continue
+            await db.delete_open_game(message_id)
+            continue
+        try:
+            message = await channel.fetch_message(message_id)
+        except (discord.NotFound, discord.Forbidden):
+            # Le message ou le salon n'existe plus : la partie ne peut pas être reprise
+            await db.delete_open_game(message_id)
+            continue
+
+        # Une partie lancée mais non terminée redevient prête à être relancée par le croupier
+        game = Game(channel.guild.id, channel_id, creator_id, montant, player_limit, croupier_id=croupier_id)
+        for user_id, (number, display_name) in players.items():
+            game.players[user_id] = Participant(user_id, display_name or str(user_id), number)
+        active_games.add(message_id, game)
+        view = GameView(message_id, player_limit, montant, creator_id)
+        bot.add_view(view, message_id=message_id)
+        # Le message affiche encore les boutons d'avant l'arrêt, désactivés si la partie avait été lancée :
+        # on affiche ceux de la vue restaurée pour que le croupier puisse la relancer
+        try:
+            await message.edit(view=view)
+        except discord.HTTPException as e:
+            print("Erreur lors de l'édition du message:", e)
+        restored += 1
+    return restored
 
 # --- VIEWS ET COMMANDES ---
 class GameView(discord.ui.View):
@@ -145,190 +347,281 @@ class GameView(discord.ui.View):
         self.message_id = message_id
         self.player_count = player_count
         self.montant = montant
-        self.chosen_numbers = {}
-        self.croupier = None
         self.creator_id = creator_id
-        self.add_number_buttons()
 
-    def add_number_buttons(self):
-        self.clear_items()
-        
-        # Boutons de numéros
+        # Les boutons sont créés une seule fois ; un clic ne modifie que l'état du bouton concerné
+        self.number_buttons = {}
         for i in range(1, 7):
-            emoji_label = EMOJI_MAPPING[i]
-            button = discord.ui.Button(label=emoji_label, style=discord.ButtonStyle.secondary, custom_id=f"number_{i}")
+            button = discord.ui.Button(label=EMOJI_MAPPING[i], style=discord.ButtonStyle.secondary, custom_id=f"number_{i}")
             button.callback = self.choose_number_callback
-            # Si un joueur a déjà choisi un numéro, on désactive le bouton correspondant
-            if i in self.chosen_numbers.values():
-                button.disabled = True
-                button.style = discord.ButtonStyle.danger
-            self.add_item(button)
+            self.number_buttons[i] = button
+        self.cancel_button = discord.ui.Button(label="❌ Annuler", style=discord.ButtonStyle.red, custom_id="cancel_game")
+        self.cancel_button.callback = self.cancel_game_callback
+        self.join_croupier_button = discord.ui.Button(label="🤝 Rejoindre en tant que Croupier", style=discord.ButtonStyle.secondary, custom_id="join_croupier")
+        self.join_croupier_button.callback = self.join_croupier_callback
+        self.start_game_button = discord.ui.Button(label="🎰 Lancer la partie !", style=discord.ButtonStyle.success, custom_id="start_game_button")
+        self.start_game_button.callback = self.start_game_button_callback
 
-        # Bouton Annuler
-        cancel_button = discord.ui.Button(label="❌ Annuler", style=discord.ButtonStyle.red, custom_id="cancel_game")
-        cancel_button.callback = self.cancel_game_callback
-        self.add_item(cancel_button)
-        
-        # Bouton Croupier
-        if len(self.chosen_numbers) >= 2 and not self.croupier:
-            join_croupier_button = discord.ui.Button(label="🤝 Rejoindre en tant que Croupier", style=discord.ButtonStyle.secondary, custom_id="join_croupier")
-            join_croupier_button.callback = self.join_croupier_callback
-            self.add_item(join_croupier_button)
+        # Ligne affichée pour chaque joueur ayant choisi son numéro, dans l'ordre d'inscription
+        self.player_lines = {}
 
-    async def choose_number_callback(self, interaction: discord.Interaction):
-        button = next((item for item in self.children if isinstance(item, discord.ui.Button) and item.custom_id == interaction.data['custom_id']), None)
-        if not button:
-            return
+        game = self.game
+        if game:
+            for participant in game.players.values():
+                if participant.number is not None:
+                    self.number_taken(participant.number, True)
+                    self.player_lines[participant.user_id] = self.player_line(participant)
+        # Une partie restaurée avec son croupier n'attend plus que le lancement
+        if game and game.croupier_id:
+            self.add_start_button()
+        else:
+            self.add_number_buttons()
 
-        user_id = interaction.user.id
-        number = int(button.custom_id.split('_')[1])
-        game_data = active_games.get(self.message_id)
+    @property
+    def game(self):
+        return active_games.get(self.message_id)
 
-        # Vérification si le créateur doit encore choisir son numéro
-        if user_id != self.creator_id and self.creator_id in self.chosen_numbers and self.chosen_numbers[self.creator_id] is None:
-            await interaction.response.send_message("❌ Le créateur doit d'abord choisir son numéro.", ephemeral=True)
-            return
+    @staticmethod
+    def player_line(participant):
+        return f"{participant.mention} a choisi le numéro **{EMOJI_MAPPING[participant.number]}**"
 
-        # Vérification si le joueur a déjà choisi un numéro
-        if user_id in self.chosen_numbers and self.chosen_numbers[user_id] is not None:
-            await interaction.response.send_message("❌ Tu as déjà choisi un numéro pour cette partie.", ephemeral=True)
-            return
+    def add_start_button(self):
+        self.clear_items()
+        self.add_item(self.start_game_button)
 
-        # Vérification si le numéro est déjà pris
-        if number in self.chosen_numbers.values():
-            await interaction.response.send_message("❌ Ce numéro est déjà pris. Choisis un autre numéro.", ephemeral=True)
-            return
-            
-        # Inscription et mise à jour des données
-        self.chosen_numbers[user_id] = number
-        game_data["players"][user_id] = {"user": interaction.user, "number": number}
+    def add_number_buttons(self):
+        self.clear_items()
+        for button in self.number_buttons.values():
+            self.add_item(button)
+        self.add_item(self.cancel_button)
+        self.update_croupier_button()
 
-        self.add_number_buttons()
+    def number_taken(self, number, taken):
+        # Si un joueur a déjà choisi un numéro, on désactive le bouton correspondant
+        button = self.number_buttons[number]
+        button.disabled = taken
+        button.style = discord.ButtonStyle.danger if taken else discord.ButtonStyle.secondary
 
-        embed = interaction.message.embeds[0]
-        
-        joined_players_list = "\n".join([f"{p_data['user'].mention} a choisi le numéro **{EMOJI_MAPPING[p_data['number']]}**" for p_data in game_data["players"].values() if p_data['number'] is not None])
+    def update_croupier_button(self):
+        game = self.game
+        wanted = game is not None and len(game.players) >= 2 and not game.croupier_id
+        shown = self.join_croupier_button in self.children
+        if wanted and not shown:
+            self.add_item(self.join_croupier_button)
+        elif shown and not wanted:
+            self.remove_item(self.join_croupier_button)
+
+    def update_player_fields(self, embed):
+        players = self.game.players
+        joined_players_list = "\n".join(self.player_lines.values())
         embed.set_field_at(0, name="Joueurs inscrits", value=joined_players_list if joined_players_list else "...", inline=False)
-        embed.set_field_at(1, name="Status", value=f"**{len(game_data['players'])}/{self.player_count}** joueurs inscrits. En attente...", inline=False)
-        
-        if len(game_data['players']) >= 2:
+        embed.set_field_at(1, name="Status", value=f"**{len(players)}/{self.player_count}** joueurs inscrits. En attente...", inline=False)
+
+    def render_join(self, embed, participant):
+        """Met à jour boutons et embed après l'inscription d'un joueur."""
+        self.number_taken(participant.number, True)
+        self.player_lines[participant.user_id] = self.player_line(participant)
+        self.update_croupier_button()
+        self.update_player_fields(embed)
+        if len(self.game.players) >= 2:
             embed.set_footer(text="Un croupier peut maintenant lancer la partie.")
 
-        await interaction.response.edit_message(embed=embed, view=self, allowed_mentions=discord.AllowedMentions(users=True))
+    def render_leave(self, embed, participant):
+        """Met à jour boutons et embed après le départ d'un joueur."""
+        if participant.number is not None:
+            self.number_taken(participant.number, False)
+        self.player_lines.pop(participant.user_id, None)
+        self.update_croupier_button()
+        self.update_player_fields(embed)
+        if len(self.game.players) < 2:
+            embed.set_footer(text="Clique sur un numéro pour t'inscrire et faire un choix.")
+
+    @instrumented("choose_number")
+    async def choose_number_callback(self, interaction: discord.Interaction):
+        user_id = interaction.user.id
+        number = int(interaction.data['custom_id'].split('_')[1])
+
+        # Le verrou empêche deux clics simultanés de réserver le même numéro
+        async with active_games.lock(self.message_id):
+            game = self.game
+            if not game or game.started:
+                await interaction.response.send_message("❌ Cette partie n'est plus disponible.", ephemeral=True)
+                return
+            players = game.players
+
+            # Vérification si le joueur participe déjà à une autre partie
+            if active_games.is_playing(game.guild_id, user_id) and active_games.game_of(game.guild_id, user_id) != self.message_id:
+                await interaction.response.send_message("❌ Tu participes déjà à une autre partie.", ephemeral=True)
+                return
+
+            # Vérification du nombre maximum de joueurs configuré sur le serveur
+            if user_id not in players and len(players) >= game.player_limit:
+                await interaction.response.send_message("❌ Cette partie est complète.", ephemeral=True)
+                return
+
+            # Vérification si le créateur doit encore choisir son numéro
+            if user_id != self.creator_id and self.creator_id in players and players[self.creator_id].number is None:
+                await interaction.response.send_message("❌ Le créateur doit d'abord choisir son numéro.", ephemeral=True)
+                return
+
+            # Vérification si le joueur a déjà choisi un numéro
+            if user_id in players and players[user_id].number is not None:
+                await interaction.response.send_message("❌ Tu as déjà choisi un numéro pour cette partie.", ephemeral=True)
+                return
+
+            # Vérification si le numéro est déjà pris
+            if any(participant.number == number for participant in players.values()):
+                await interaction.response.send_message("❌ Ce numéro est déjà pris. Choisis un autre numéro.", ephemeral=True)
+                return
+                
+            # Inscription et mise à jour des données
+            participant = Participant(user_id, interaction.user.display_name, number)
+            active_games.add_player(self.message_id, participant)
 
+            embed = interaction.message.embeds[0]
+            self.render_join(embed, participant)
+
+            await interaction.response.edit_message(embed=embed, view=self, allowed_mentions=discord.AllowedMentions(users=True))
+            save_game_snapshot(self.message_id)
+
+    @instrumented("cancel_game")
     async def cancel_game_callback(self, interaction: discord.Interaction):
-        game_data = active_games.get(self.message_id)
         user_id = interaction.user.id
-        
-        if user_id not in self.chosen_numbers.keys():
-            await interaction.response.send_message("❌ Tu n'es pas inscrit à cette partie.", ephemeral=True)
-            return
 
-        # Cas 1 : Le créateur de la partie annule tout
-        if user_id == self.creator_id:
-            active_games.pop(self.message_id)
+        async with active_games.lock(self.message_id):
+            game = self.game
+            if not game or game.started:
+                await interaction.response.send_message("❌ Cette partie n'est plus disponible.", ephemeral=True)
+                return
+            players = game.players
             
-            embed = interaction.message.embeds[0]
-            embed.title = "❌ Partie annulée"
-            embed.description = f"La partie a été annulée par {interaction.user.mention}."
-            embed.color = discord.Color.red()
+            if user_id not in players:
+                await interaction.response.send_message("❌ Tu n'es pas inscrit à cette partie.", ephemeral=True)
+                return
+
+            # Cas 1 : Le créateur de la partie annule tout
+            if user_id == self.creator_id:
+                active_games.remove(self.message_id)
+                edit_scheduler.forget(self.message_id)
+                
+                embed = interaction.message.embeds[0]
+                embed.title = "❌ Partie annulée"
+                embed.description = f"La partie a été annulée par {interaction.user.mention}."
+                embed.color = discord.Color.red()
+                
+                await interaction.response.edit_message(embed=embed, view=None, allowed_mentions=discord.AllowedMentions(users=True))
+                await db.delete_open_game(self.message_id)
+                return
+                
+            # Cas 2 : Un autre joueur quitte la partie
+            else:
+                participant = players[user_id]
+                active_games.remove_player(self.message_id, user_id)
+                if len(players) < 2:
+                    game.croupier_id = None
+                
+                embed = interaction.message.embeds[0]
+                self.render_leave(embed, participant)
+                
+                await interaction.response.edit_message(content=f"**{interaction.user.mention}** a quitté la partie.", embed=embed, view=self, allowed_mentions=discord.AllowedMentions(users=True))
+                save_game_snapshot(self.message_id)
             
-            await interaction.response.edit_message(embed=embed, view=None, allowed_mentions=discord.AllowedMentions(users=True))
+    @instrumented("join_croupier")
+    async def join_croupier_callback(self, interaction: discord.Interaction):
+        croupier_role_id = guild_configs.get(interaction.guild_id).croupier_role_id
+        
+        if not croupier_role_id or not interaction.user.get_role(croupier_role_id):
+            await interaction.response.send_message("❌ Tu n'as pas le rôle de `croupier` pour rejoindre cette partie.", ephemeral=True)
             return
             
-        # Cas 2 : Un autre joueur quitte la partie
-        else:
-            del self.chosen_numbers[user_id]
-            del game_data["players"][user_id]
+        async with active_games.lock(self.message_id):
+            game = self.game
+            if not game or game.croupier_id or len(game.players) < 2:
+                await interaction.response.send_message("❌ Cette partie n'attend plus de croupier.", ephemeral=True)
+                return
+            game.croupier_id = interaction.user.id
             
-            self.add_number_buttons()
+            self.add_start_button()
             
             embed = interaction.message.embeds[0]
-            joined_players_list = "\n".join([f"{p_data['user'].mention} a choisi le numéro **{EMOJI_MAPPING[p_data['number']]}**" for p_data in game_data["players"].values() if p_data['number'] is not None])
-            embed.set_field_at(0, name="Joueurs inscrits", value=joined_players_list if joined_players_list else "...", inline=False)
-            embed.set_field_at(1, name="Status", value=f"**{len(game_data['players'])}/{self.player_count}** joueurs inscrits. En attente...", inline=False)
+            embed.set_field_at(1, name="Status", value=f"✅ Prêt à jouer ! Croupier : {interaction.user.mention}", inline=False)
             
-            if len(game_data['players']) < 2:
-                self.clear_items()
-                self.add_number_buttons()
-                embed.set_footer(text="Clique sur un numéro pour t'inscrire et faire un choix.")
-                if "croupier" in game_data:
-                    del game_data["croupier"]
-            
-            await interaction.response.edit_message(content=f"**{interaction.user.mention}** a quitté la partie.", embed=embed, view=self, allowed_mentions=discord.AllowedMentions(users=True))
-            
-    async def join_croupier_callback(self, interaction: discord.Interaction):
-        role_croupier = interaction.guild.get_role(ID_CROUPIER)
-        
-        if not role_croupier or role_croupier not in interaction.user.roles:
-            await interaction.response.send_message("❌ Tu n'as pas le rôle de `croupier` pour rejoindre cette partie.", ephemeral=True)
-            return
-            
-        game_data = active_games.get(self.message_id)
-        self.croupier = interaction.user
-        game_data["croupier"] = interaction.user
-        
-        self.clear_items()
-        start_game_button = discord.ui.Button(label="🎰 Lancer la partie !", style=discord.ButtonStyle.success, custom_id="start_game_button")
-        start_game_button.callback = self.start_game_button_callback
-        self.add_item(start_game_button)
-        
-        embed = interaction.message.embeds[0]
-        embed.set_field_at(1, name="Status", value=f"✅ Prêt à jouer ! Croupier : {interaction.user.mention}", inline=False)
-        
-        await interaction.response.edit_message(embed=embed, view=self, allowed_mentions=discord.AllowedMentions(users=True))
+            await interaction.response.edit_message(embed=embed, view=self, allowed_mentions=discord.AllowedMentions(users=True))
+            save_game_snapshot(self.message_id)
         
+    @instrumented("start_game_button")
     async def start_game_button_callback(self, interaction: discord.Interaction):
-        game_data = active_games.get(self.message_id)
-        
-        if interaction.user.id != game_data["croupier"].id:
-            await interaction.response.send_message("❌ Seul le croupier peut lancer la partie.", ephemeral=True)
-            return
+        async with active_games.lock(self.message_id):
+            game = self.game
+            if not game or game.started:
+                await interaction.response.send_message("❌ Cette partie a déjà été lancée.", ephemeral=True)
+                return
             
-        await interaction.response.defer()
-        
+            if interaction.user.id != game.croupier_id:
+                await interaction.response.send_message("❌ Seul le croupier peut lancer la partie.", ephemeral=True)
+                return
+
+            # Plus aucune inscription ni départ n'est accepté une fois la partie lancée
+            game.started = True
+            
+        # La réponse à l'interaction désactive aussi les boutons : un seul appel au lieu de defer + édition
         for item in self.children:
             item.disabled = True
-        await interaction.edit_original_response(view=self)
+        await interaction.response.edit_message(view=self)
         
-        original_message = await interaction.channel.fetch_message(self.message_id)
-        await end_game(interaction, game_data, original_message)
+        # Le message de la partie est celui du bouton cliqué, inutile de le relire
+        await end_game(interaction, game, interaction.message)
         
     async def on_timeout(self):
-        game_data = active_games.get(self.message_id)
-        if game_data and len(game_data["players"]) < 2:
+        game = self.game
+        if game and len(game.players) < 2:
             try:
                 message = await self.ctx.channel.fetch_message(self.message_id)
                 embed = message.embeds[0]
                 embed.title = "❌ Partie expirée"
                 embed.description = "La partie a expiré car il n'y a pas assez de joueurs."
                 embed.color = discord.Color.red()
-                await message.edit(embed=embed, view=None)
+                await edit_scheduler.edit(message, embed=embed, view=None)
             except discord.NotFound:
                 pass
-            active_games.pop(self.message_id, None)
+            active_games.remove(self.message_id)
+            edit_scheduler.forget(self.message_id)
+            await db.delete_open_game(self.message_id)
 
 # --- COMMANDES ---
+async def check_game_channel(interaction: discord.Interaction, config):
+    """Refuse la commande hors des salons de jeu du serveur. Retourne True si elle peut être traitée."""
+    if interaction.channel.id in config.game_channels:
+        return True
+    if not config.game_channels:
+        await interaction.response.send_message("❌ Aucun salon de jeu n'est configuré sur ce serveur. Un administrateur peut en ajouter avec `/config`.", ephemeral=True)
+    else:
+        await interaction.response.send_message(f"❌ Cette commande ne peut être utilisée que dans : {config.channel_mentions()}.", ephemeral=True)
+    return False
+
 @bot.tree.command(name="duel", description="Lancer une partie de Numéro Mystère.")
 @app_commands.describe(montant="Montant misé en kamas")
+@app_commands.guild_only()
+@instrumented("duel")
 async def startgame(interaction: discord.Interaction, montant: int):
-    if interaction.channel.id != ID_SALON_JEU:
-        await interaction.response.send_message("❌ Cette commande ne peut être utilisée que dans le salon #『🔮』numéro•mystère.", ephemeral=True)
+    config = guild_configs.get(interaction.guild_id)
+    if not await check_game_channel(interaction, config):
         return
 
     if montant <= 0:
         await interaction.response.send_message("❌ Le montant doit être supérieur à 0.", ephemeral=True)
         return
     
-    for message_id, game_data in active_games.items():
-        if interaction.user.id in game_data["players"].keys():
-            await interaction.response.send_message("❌ Tu participes déjà à une autre partie.", ephemeral=True)
-            return
+    # Le créateur est réservé tout de suite pour qu'un double /duel ne crée pas deux parties
+    if not active_games.reserve(interaction.guild_id, interaction.user.id):
+        await interaction.response.send_message("❌ Tu participes déjà à une autre partie.", ephemeral=True)
+        return
 
-    MAX_JOUEURS = 6
+    MAX_JOUEURS = config.max_players
     
-    # Création des données de jeu et inscription automatique du créateur
-    game_data = {"players": {interaction.user.id: {"user": interaction.user, "number": None}}, "montant": montant, "croupier": None, "player_limit": MAX_JOUEURS}
+    # Création des données de jeu et inscription automatique du créateur (sans numéro)
+    game = Game(interaction.guild_id, interaction.channel.id, interaction.user.id, montant, MAX_JOUEURS)
+    game.players[interaction.user.id] = Participant(interaction.user.id, interaction.user.display_name)
     
     embed = discord.Embed(
         title="🔮 Nouvelle Partie de Numéro Mystère",
@@ -341,35 +634,76 @@ async def startgame(interaction: discord.Interaction, montant: int):
     embed.set_footer(text="Le créateur choisit son numéro en premier.")
 
     view = GameView(None, MAX_JOUEURS, montant, interaction.user.id)
-    view.chosen_numbers[interaction.user.id] = None  # Le créateur est dans la liste mais sans numéro
     
     ping_content = ""
-    role_membre = interaction.guild.get_role(ID_MEMBRE)
-    if role_membre:
-        ping_content = f"{role_membre.mention} — Une nouvelle partie est prête ! Rejoignez-la !"
+    if config.member_mention:
+        ping_content = f"{config.member_mention} — Une nouvelle partie est prête ! Rejoignez-la !"
     
-    await interaction.response.send_message(
-        content=ping_content,
-        embed=embed,
-        view=view,
-        ephemeral=False,
-        allowed_mentions=discord.AllowedMentions(roles=True, users=True)
-    )
+    try:
+        await interaction.response.send_message(
+            content=ping_content,
+            embed=embed,
+            view=view,
+            ephemeral=False,
+            allowed_mentions=discord.AllowedMentions(roles=True, users=True)
+        )
+        sent_message = await interaction.original_response()
+    except discord.HTTPException:
+        active_games.release(interaction.guild_id, interaction.user.id)
+        raise
 
-    sent_message = await interaction.original_response()
     view.message_id = sent_message.id
-    active_games[sent_message.id] = game_data
-    await sent_message.edit(view=view)
+    active_games.add(sent_message.id, game)
+    # send_message a enregistré la vue sous l'identifiant de l'interaction : on la rattache au message
+    # comme le ferait une édition (edit_original_response), mais sans appel REST
+    bot._connection.store_view(view, sent_message.id, interaction_id=interaction.id)
+    save_game_snapshot(sent_message.id)
+
+# --- PÉRIODES ---
+PERIODES = [
+    app_commands.Choice(name="Tout l'historique", value="tout"),
+    app_commands.Choice(name="Aujourd'hui", value="jour"),
+    app_commands.Choice(name="Cette semaine", value="semaine"),
+    app_commands.Choice(name="Ce mois-ci", value="mois"),
+    app_commands.Choice(name="Personnalisée (début / fin)", value="perso"),
+]
+
+def resolve_period(periode, debut, fin):
+    """Retourne (période, libellé) ; la période est un couple de jours inclus, ou None pour tout l'historique.
+
+    Lève ValueError si les dates d'une période personnalisée sont absentes ou invalides.
+    """
+    # Les dates des parties sont enregistrées en UTC
+    today = datetime.utcnow().date()
+    if periode is None or periode == "tout":
+        return None, "Tout l'historique"
+    if periode == "jour":
+        return (today.isoformat(), today.isoformat()), "Aujourd'hui"
+    if periode == "semaine":
+        start = today - timedelta(days=today.weekday())
+        return (start.isoformat(), today.isoformat()), "Cette semaine"
+    if periode == "mois":
+        return (today.replace(day=1).isoformat(), today.isoformat()), "Ce mois-ci"
+    if not debut:
+        raise ValueError("début manquant")
+    start = date.fromisoformat(debut)
+    end = date.fromisoformat(fin) if fin else today
+    if end < start:
+        raise ValueError("période inversée")
+    return (start.isoformat(), end.isoformat()), f"Du {start:%d/%m/%Y} au {end:%d/%m/%Y}"
 
 # --- STATS VIEWS AND COMMANDS ---
 class StatsView(discord.ui.View):
-    def __init__(self, ctx, entries, page=0):
+    def __init__(self, ctx, generation, player_count, period=None, period_label=None, page=0):
         super().__init__(timeout=120)
         self.ctx = ctx
-        self.entries = entries
+        self.guild_id = ctx.guild_id
+        self.generation = generation
+        self.period = period
+        self.period_label = period_label
         self.page = page
-        self.entries_per_page = 10
-        self.max_page = (len(entries) - 1) // self.entries_per_page
+        self.entries_per_page = leaderboard.per_page
+        self.max_page = (player_count - 1) // self.entries_per_page
         self.update_buttons()
 
     def update_buttons(self):
@@ -378,11 +712,17 @@ class StatsView(discord.ui.View):
         self.next_page.disabled = self.page == self.max_page
         self.last_page.disabled = self.page == self.max_page
 
-    def get_embed(self):
-        embed = discord.Embed(title="📊 Statistiques globales des parties", color=discord.Color.gold())
-        start = self.page * self.entries_per_page
-        end = start + self.entries_per_page
-        slice_entries = self.entries[start:end]
+    async def get_embed(self):
+        embed = await leaderboard.page(self.generation, self.guild_id, self.page, self.render_page, self.period, self.period_label)
+        # La page suivante est chargée pendant que l'utilisateur lit celle-ci
+        leaderboard.prefetch(self.generation, self.guild_id, self.page + 1, self.period)
+        return embed
+
+    def render_page(self, slice_entries):
+        title = "📊 Statistiques globales des parties"
+        if self.period:
+            title += f" — {self.period_label}"
+        embed = discord.Embed(title=title, color=discord.Color.gold())
 
         if not slice_entries:
             embed.description = "Aucune donnée à afficher."
@@ -408,112 +748,72 @@ class StatsView(discord.ui.View):
     async def first_page(self, interaction: discord.Interaction, button: discord.ui.Button):
         self.page = 0
         self.update_buttons()
-        await interaction.response.edit_message(embed=self.get_embed(), view=self)
+        await interaction.response.edit_message(embed=await self.get_embed(), view=self)
 
     @discord.ui.button(label="◀️", style=discord.ButtonStyle.secondary)
     async def prev_page(self, interaction: discord.Interaction, button: discord.ui.Button):
         if self.page > 0:
             self.page -= 1
         self.update_buttons()
-        await interaction.response.edit_message(embed=self.get_embed(), view=self)
+        await interaction.response.edit_message(embed=await self.get_embed(), view=self)
 
     @discord.ui.button(label="▶️", style=discord.ButtonStyle.secondary)
     async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
         if self.page < self.max_page:
             self.page += 1
         self.update_buttons()
-        await interaction.response.edit_message(embed=self.get_embed(), view=self)
+        await interaction.response.edit_message(embed=await self.get_embed(), view=self)
 
     @discord.ui.button(label="⏭️", style=discord.ButtonStyle.secondary)
     async def last_page(self, interaction: discord.Interaction, button: discord.ui.Button):
         self.page = self.max_page
         self.update_buttons()
-        await interaction.response.edit_message(embed=self.get_embed(), view=self)
+        await interaction.response.edit_message(embed=await self.get_embed(), view=self)
 
 @bot.tree.command(name="statsall", description="Affiche les stats du jeu de Numéro Mystère.")
-async def statsall(interaction: discord.Interaction):
-    if interaction.channel.id != ID_SALON_JEU:
-        await interaction.response.send_message("❌ Cette commande ne peut être utilisée que dans le salon #『🔮』numéro•mystère.", ephemeral=True)
+@app_commands.describe(periode="Période des statistiques", debut="Début d'une période personnalisée (AAAA-MM-JJ)", fin="Fin d'une période personnalisée (AAAA-MM-JJ, aujourd'hui par défaut)")
+@app_commands.choices(periode=PERIODES)
+@app_commands.guild_only()
+@instrumented("statsall")
+async def statsall(interaction: discord.Interaction, periode: app_commands.Choice[str] = None, debut: str = None, fin: str = None):
+    if not await check_game_channel(interaction, guild_configs.get(interaction.guild_id)):
         return
 
-    c.execute("""
-    WITH GameStats AS (
-      SELECT
-        game_id,
-        SUM(montant) AS total_pot,
-        COUNT(DISTINCT gagnant_id) AS num_winners
-      FROM games
-      GROUP BY game_id
-    )
-    SELECT
-      g.joueur_id,
-      COUNT(g.joueur_id) AS total_parties,
-      SUM(g.montant) AS total_mises,
-      SUM(
-        CASE
-          WHEN g.gagnant_id = g.joueur_id THEN
-            (gs.total_pot * 0.95) / gs.num_winners
-          ELSE
-            0
-        END
-      ) AS total_gagnes,
-      SUM(CASE WHEN g.gagnant_id = g.joueur_id THEN 1 ELSE 0 END) AS victoires
-    FROM games g
-    JOIN GameStats gs ON g.game_id = gs.game_id
-    GROUP BY g.joueur_id
-    ORDER BY total_gagnes DESC
-    """)
-    
-    data = c.fetchall()
+    try:
+        period, period_label = resolve_period(periode.value if periode else None, debut, fin)
+    except ValueError:
+        await interaction.response.send_message("❌ Période invalide. Utilise le format AAAA-MM-JJ pour `debut` et `fin`.", ephemeral=True)
+        return
 
-    stats = []
-    for user_id, total_parties, total_mises, total_gagnes, victoires in data:
-        winrate = (victoires / total_parties * 100) if total_parties > 0 else 0.0
-        stats.append((user_id, total_parties, total_mises, total_gagnes, victoires, winrate))
+    generation, player_count = await leaderboard.open(interaction.guild_id, period)
 
-    if not stats:
+    if not player_count:
         await interaction.response.send_message("Aucune donnée statistique disponible.", ephemeral=True)
         return
 
-    view = StatsView(interaction, stats)
-    await interaction.response.send_message(embed=view.get_embed(), view=view, ephemeral=False)
+    view = StatsView(interaction, generation, player_count, period, period_label)
+    await interaction.response.send_message(embed=await view.get_embed(), view=view, ephemeral=False)
 
 @bot.tree.command(name="mystats", description="Affiche tes statistiques de Numéro Mystère.")
-async def mystats(interaction: discord.Interaction):
+@app_commands.describe(periode="Période des statistiques", debut="Début d'une période personnalisée (AAAA-MM-JJ)", fin="Fin d'une période personnalisée (AAAA-MM-JJ, aujourd'hui par défaut)")
+@app_commands.choices(periode=PERIODES)
+@app_commands.guild_only()
+@instrumented("mystats")
+async def mystats(interaction: discord.Interaction, periode: app_commands.Choice[str] = None, debut: str = None, fin: str = None):
     user_id = interaction.user.id
 
-    c.execute("""
-    SELECT
-      SUM(g.montant) AS total_mise,
-      SUM(
-        CASE
-          WHEN g.gagnant_id = g.joueur_id THEN
-            (gs.total_pot * 0.95) / gs.num_winners
-          ELSE
-            0
-        END
-      ) AS kamas_gagnes,
-      SUM(CASE WHEN g.gagnant_id = g.joueur_id THEN 1 ELSE 0 END) AS victoires,
-      COUNT(*) AS total_parties
-    FROM games g
-    JOIN (
-      SELECT
-        game_id,
-        SUM(montant) AS total_pot,
-        COUNT(DISTINCT gagnant_id) AS num_winners
-      FROM games
-      GROUP BY game_id
-    ) gs ON g.game_id = gs.game_id
-    WHERE g.joueur_id = ?
-    GROUP BY g.joueur_id;
-    """, (user_id,))
-    
-    stats_data = c.fetchone()
+    try:
+        period, period_label = resolve_period(periode.value if periode else None, debut, fin)
+    except ValueError:
+        await interaction.response.send_message("❌ Période invalide. Utilise le format AAAA-MM-JJ pour `debut` et `fin`.", ephemeral=True)
+        return
+
+    stats_data = await db.fetch_player_stats(interaction.guild_id, user_id, period)
     
     if not stats_data:
         embed = discord.Embed(
             title="📊 Tes Statistiques de Numéro Mystère",
-            description="❌ Tu n'as pas encore participé à une partie.",
+            description="❌ Tu n'as pas encore participé à une partie." if period is None else f"❌ Aucune partie jouée sur cette période ({period_label}).",
             color=discord.Color.red()
         )
         await interaction.response.send_message(embed=embed, ephemeral=True)
@@ -524,7 +824,7 @@ async def mystats(interaction: discord.Interaction):
 
     embed = discord.Embed(
         title=f"📊 Statistiques de {interaction.user.display_name}",
-        description="Voici un résumé de tes performances au jeu du Numéro Mystère.",
+        description="Voici un résumé de tes performances au jeu du Numéro Mystère." if period is None else f"Voici un résumé de tes performances au jeu du Numéro Mystère ({period_label}).",
         color=discord.Color.gold()
     )
     embed.add_field(name="Total misé", value=f"**{mises:,.0f}".replace(",", " ") + " kamas**", inline=False)
@@ -542,14 +842,275 @@ async def mystats(interaction: discord.Interaction):
 
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
+# --- HISTORIQUE ---
+def format_game_date(value):
+    # Les dates sont enregistrées en UTC ; Discord les affiche dans le fuseau de chaque utilisateur
+    try:
+        return f"<t:{int(datetime.fromisoformat(str(value)).replace(tzinfo=timezone.utc).timestamp())}:f>"
+    except ValueError:
+        return str(value)
+
+class HistoryView(discord.ui.View):
+    entries_per_page = 10
+
+    def __init__(self, guild_id, member, rows, has_older):
+        super().__init__(timeout=120)
+        self.guild_id = guild_id
+        self.member = member
+        self.rows = rows
+        self.has_older = has_older
+        self.page = 0
+        self.update_buttons()
+
+    def update_buttons(self):
+        self.newer_page.disabled = self.page == 0
+        self.older_page.disabled = not self.has_older
+
+    def render(self):
+        embed = discord.Embed(title=f"📜 Historique de {self.member.display_name}", color=discord.Color.gold())
+        lines = []
+        for game_id, game_date, montant, numero_choisi, numero_resultat, is_winner, gain, nb_joueurs in self.rows:
+            result = f"**+{gain:,.0f}".replace(",", " ") + " kamas**" if is_winner else f"**-{montant:,.0f}".replace(",", " ") + " kamas**"
+            lines.append(
+                f"{'✅' if is_winner else '❌'} {format_game_date(game_date)} — "
+                f"{EMOJI_MAPPING[numero_choisi]} → {EMOJI_MAPPING[numero_resultat]} | "
+                f"{nb_joueurs} joueurs | {result}"
+            )
+        embed.description = "\n".join(lines) if lines else "Aucune partie à afficher."
+        embed.set_footer(text=f"Page {self.page + 1}")
+        return embed
+
+    @discord.ui.button(label="◀️ Plus récentes", style=discord.ButtonStyle.secondary)
+    async def newer_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if self.page <= 1:
+            # Retour à la première page : relue en entier pour inclure les parties jouées entre-temps
+            rows = await db.fetch_player_history(self.guild_id, self.member.id, self.entries_per_page + 1)
+            self.rows = rows[:self.entries_per_page]
+            self.has_older = len(rows) > self.entries_per_page
+            self.page = 0
+        else:
+            # Clé de la partie la plus récente affichée : on remonte d'une page sans OFFSET
+            self.rows = await db.fetch_player_history(self.guild_id, self.member.id, self.entries_per_page, after=self.rows[0][0])
+            self.has_older = True
+            self.page -= 1
+        self.update_buttons()
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+    @discord.ui.button(label="Plus anciennes ▶️", style=discord.ButtonStyle.secondary)
+    async def older_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        # Une ligne de plus que la page : elle indique s'il reste des parties plus anciennes
+        rows = await db.fetch_player_history(self.guild_id, self.member.id, self.entries_per_page + 1, before=self.rows[-1][0])
+        if rows:
+            self.rows = rows[:self.entries_per_page]
+            self.has_older = len(rows) > self.entries_per_page
+            self.page += 1
+        else:
+            self.has_older = False
+        self.update_buttons()
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+@bot.tree.command(name="historique", description="Affiche les dernières parties d'un joueur.")
+@app_commands.describe(joueur="Joueur dont afficher l'historique (toi par défaut)")
+@app_commands.guild_only()
+@instrumented("historique")
+async def historique(interaction: discord.Interaction, joueur: discord.Member = None):
+    member = joueur or interaction.user
+    rows = await db.fetch_player_history(interaction.guild_id, member.id, HistoryView.entries_per_page + 1)
+    if not rows:
+        await interaction.response.send_message(f"❌ {member.display_name} n'a encore joué aucune partie sur ce serveur.", ephemeral=True)
+        return
+
+    view = HistoryView(interaction.guild_id, member, rows[:HistoryView.entries_per_page], len(rows) > HistoryView.entries_per_page)
+    await interaction.response.send_message(embed=view.render(), view=view, ephemeral=True)
+
+@bot.tree.command(name="export", description="Exporte l'historique des parties du serveur (fichier compressé).")
+@app_commands.describe(fmt="Format du fichier", joueur="N'exporter que les parties de ce joueur")
+@app_commands.rename(fmt="format")
+@app_commands.choices(fmt=[
+    app_commands.Choice(name="CSV", value="csv"),
+    app_commands.Choice(name="JSON Lines", value="jsonl"),
+])
+@app_commands.guild_only()
+@app_commands.checks.has_permissions(administrator=True)
+async def export(interaction: discord.Interaction, fmt: app_commands.Choice[str], joueur: discord.Member = None):
+    await interaction.response.defer(ephemeral=True)
+    suffix = f"_{joueur.id}" if joueur else ""
+    path = os.path.join(EXPORT_DIR, f"historique_{interaction.guild_id}{suffix}_{datetime.utcnow():%Y%m%d_%H%M%S}.{fmt.value}.gz")
+    try:
+        # Les parties encore en file d'attente font partie de l'export
+        await db.flush()
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        count = await db.export_history(path, fmt.value, interaction.guild_id, joueur.id if joueur else None)
+        size = os.path.getsize(path)
+    except Exception as e:
+        print("Erreur lors de l'export de l'historique:", e)
+        # Un export interrompu laisse un fichier incomplet
+        if os.path.exists(path):
+            os.remove(path)
+        await interaction.followup.send("❌ L'export a échoué, réessaie plus tard.", ephemeral=True)
+        return
+
+    message = f"✅ **{count}** lignes exportées ({size / 1e6:.1f} Mo)."
+    # Trop lourd pour une pièce jointe : le fichier reste disponible sur le serveur du bot
+    if size <= interaction.guild.filesize_limit:
+        try:
+            await interaction.followup.send(message, file=discord.File(path), ephemeral=True)
+        finally:
+            # Envoyé en pièce jointe : inutile de le garder sur le serveur du bot
+            os.remove(path)
+    else:
+        await interaction.followup.send(f"{message}\nFichier trop volumineux pour Discord, enregistré sur le serveur du bot : `{path}`", ephemeral=True)
+
+@bot.tree.command(name="config", description="Configure le Numéro Mystère sur ce serveur.")
+@app_commands.describe(
+    ajouter_salon="Salon où les parties sont autorisées",
+    retirer_salon="Salon où les parties ne sont plus autorisées",
+    role_croupier="Rôle autorisé à rejoindre et lancer les parties",
+    role_membre="Rôle mentionné à chaque nouvelle partie",
+    commission="Commission prélevée sur le pot, en pourcentage",
+    max_joueurs="Nombre maximum de joueurs par partie"
+)
+@app_commands.guild_only()
+@app_commands.checks.has_permissions(administrator=True)
+async def configure(
+    interaction: discord.Interaction,
+    ajouter_salon: discord.TextChannel = None,
+    retirer_salon: discord.TextChannel = None,
+    role_croupier: discord.Role = None,
+    role_membre: discord.Role = None,
+    commission: app_commands.Range[float, 0, 50] = None,
+    max_joueurs: app_commands.Range[int, 2, 6] = None
+):
+    config = guild_configs.get(interaction.guild_id)
+    changes = {}
+    channels = set(config.game_channels)
+    if ajouter_salon:
+        channels.add(ajouter_salon.id)
+    if retirer_salon:
+        channels.discard(retirer_salon.id)
+    if channels != config.game_channels:
+        changes["game_channels"] = frozenset(channels)
+    if role_croupier:
+        changes["croupier_role_id"] = role_croupier.id
+    if role_membre:
+        changes["member_role_id"] = role_membre.id
+    if commission is not None:
+        changes["commission"] = commission / 100
+    if max_joueurs is not None:
+        changes["max_players"] = max_joueurs
+    # Sans option, la commande affiche simplement la configuration actuelle
+    if changes:
+        config = await guild_configs.update(interaction.guild_id, **changes)
+
+    embed = discord.Embed(title="⚙️ Configuration du Numéro Mystère", color=discord.Color.gold())
+    embed.add_field(name="Salons de jeu", value=config.channel_mentions() or "Aucun", inline=False)
+    embed.add_field(name="Rôle croupier", value=f"<@&{config.croupier_role_id}>" if config.croupier_role_id else "Aucun", inline=True)
+    embed.add_field(name="Rôle membre", value=config.member_mention or "Aucun", inline=True)
+    embed.add_field(name="Commission", value=f"**{config.commission * 100:g}%**", inline=True)
+    embed.add_field(name="Joueurs max", value=f"**{config.max_players}**", inline=True)
+    if changes:
+        embed.set_footer(text="✅ Configuration enregistrée. Les parties déjà ouvertes gardent leur nombre de joueurs.")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="rebuildstats", description="Reconstruit les statistiques du serveur à partir de l'historique des parties.")
+@app_commands.guild_only()
+@app_commands.checks.has_permissions(administrator=True)
+async def rebuildstats(interaction: discord.Interaction):
+    await interaction.response.defer(ephemeral=True)
+    await db.flush()
+    # Vérification avant reconstruction : après, les cumuls seraient égaux à l'agrégation par construction.
+    # Seuls les cumuls de ce serveur sont touchés : les autres serveurs ne bloquent pas sur l'écrivain
+    mismatches = await db.check_player_stats(interaction.guild_id)
+    count = await db.rebuild_stats(interaction.guild_id)
+    await interaction.followup.send(f"✅ Statistiques reconstruites pour **{count}** joueurs (**{len(mismatches)}** cumul(s) incohérent(s) corrigé(s)).", ephemeral=True)
+
+@bot.tree.command(name="checkstats", description="Compare les statistiques cumulées du serveur à l'historique des parties, sans les modifier.")
+@app_commands.guild_only()
+@app_commands.checks.has_permissions(administrator=True)
+async def checkstats(interaction: discord.Interaction):
+    await interaction.response.defer(ephemeral=True)
+    await db.flush()
+    mismatches = await db.check_player_stats(interaction.guild_id)
+    if mismatches:
+        await interaction.followup.send(f"⚠️ **{len(mismatches)}** cumul(s) incohérent(s) avec l'historique. Utilise /rebuildstats pour les corriger.", ephemeral=True)
+    else:
+        await interaction.followup.send("✅ Les statistiques cumulées correspondent à l'historique.", ephemeral=True)
+
+async def is_bot_owner(interaction: discord.Interaction):
+    return await interaction.client.is_owner(interaction.user)
+
+# La file d'attente est commune à tous les serveurs : réservé au propriétaire du bot
+@bot.tree.command(name="flush", description="Écrit immédiatement les parties en attente dans la base de données.")
+@app_commands.check(is_bot_owner)
+async def flush(interaction: discord.Interaction):
+    await interaction.response.defer(ephemeral=True)
+    written = await db.flush()
+    avg_ms = db.total_flush_ms / db.flush_count if db.flush_count else 0.0
+    await interaction.followup.send(
+        f"✅ **{written}** parties écrites.\n"
+        f"File d'attente : **{db.queue_depth}** | Flushs : **{db.flush_count}** ({db.flushed_games} parties) | "
+        f"Dernier : **{db.last_flush_ms:.1f} ms** | Moyenne : **{avg_ms:.1f} ms**",
+        ephemeral=True
+    )
+
+async def adopt_legacy_guild():
+    """Premier démarrage multi-serveur : le serveur d'origine reprend l'ancienne configuration et l'historique."""
+    channel = bot.get_channel(ID_SALON_JEU)
+    if channel is None or channel.guild.id in guild_configs:
+        return
+    await guild_configs.update(channel.guild.id, game_channels=frozenset({ID_SALON_JEU}), croupier_role_id=ID_CROUPIER, member_role_id=ID_MEMBRE)
+    moved = await db.adopt_legacy_history(channel.guild.id)
+    print(f"⚙️ Configuration d'origine reprise pour {channel.guild.name} ({moved} partie(s) rattachée(s)).")
+
+# --- ÉTAT DE LA PASSERELLE ---
+# is_ready() reste vrai pendant une déconnexion : /ready s'appuie sur ces événements pour répondre 503
+@bot.listen("on_shard_disconnect")
+async def track_shard_disconnect(shard_id):
+    bot.disconnected_shards.add(shard_id)
+
+@bot.listen("on_shard_connect")
+@bot.listen("on_shard_resumed")
+async def track_shard_connect(shard_id):
+    bot.disconnected_shards.discard(shard_id)
+
+# Sans shards, seuls les événements globaux sont émis (avec shards, ils le sont aussi, mais sans identifiant)
+@bot.listen("on_disconnect")
+async def track_disconnect():
+    if not SHARDED:
+        bot.disconnected_shards.add(0)
+
+@bot.listen("on_connect")
+@bot.listen("on_resumed")
+async def track_connect():
+    if not SHARDED:
+        bot.disconnected_shards.discard(0)
+
+@bot.event
+async def on_guild_remove(guild):
+    # Le bot a quitté le serveur : ses parties ouvertes ne pourront plus être jouées
+    for message_id in active_games.remove_guild(guild.id):
+        edit_scheduler.forget(message_id)
+        await db.delete_open_game(message_id)
+
 @bot.event
 async def on_ready():
     print(f"{bot.user} est prêt !")
+    # on_ready peut être rappelé après une reconnexion : la restauration n'a lieu qu'une fois
+    if not bot.games_restored:
+        bot.games_restored = True
+        await adopt_legacy_guild()
+        restored = await restore_open_games()
+        if restored:
+            print(f"♻️ {restored} partie(s) restaurée(s).")
+    # Les commandes sont globales : un seul processus (celui du shard 0) les synchronise
+    if SHARD_IDS is not None and 0 not in SHARD_IDS:
+        return
     try:
         await bot.tree.sync()
         print("✅ Commandes synchronisées.")
     except Exception as e:
         print(f"Erreur : {e}")
 
-keep_alive()
-bot.run(token)
+if __name__ == "__main__":
+    bot.run(os.environ['TOKEN_BOT_DISCORD'])
+    db.close()
@@ -0,0 +1,104 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+# Bornes des histogrammes de latence, en secondes
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+class Collector:
+    """Compteurs et histogrammes en mémoire, exportés au format texte Prometheus.
+
+    Les mises à jour ne font qu'incrémenter des valeurs sous un verrou court : on peut
+    les appeler depuis la boucle asyncio comme depuis les threads de la base de données.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._callbacks = {}
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # Un compteur par borne, puis la somme et le nombre d'observations
+                histogram = self._histograms[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def register(self, name, func, kind="gauge"):
+        """Valeur lue au moment de l'export (profondeur de file, compteurs d'un autre module...)."""
+        self._callbacks[name] = (kind, func)
+
+    def render(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(values) for key, values in self._histograms.items()}
+        lines = []
+
+        seen = set()
+        for (name, labels), value in sorted(counters.items()):
+            if name not in seen:
+                lines.append(f"# TYPE {name} counter")
+                seen.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for (name, labels), values in sorted(histograms.items()):
+            if name not in seen:
+                lines.append(f"# TYPE {name} histogram")
+                seen.add(name)
+            for bound, count in zip(self.buckets, values):
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {values[-1]}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {values[-2]}")
+            lines.append(f"{name}_count{_format_labels(labels)} {values[-1]}")
+
+        for name, (kind, func) in sorted(self._callbacks.items()):
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {func()}")
+
+        return "\n".join(lines) + "\n"
+
+
+class RateLimitHandler(logging.Handler):
+    """Compte les réponses 429 signalées par le logger HTTP de discord.py."""
+
+    def __init__(self, collector):
+        super().__init__(level=logging.WARNING)
+        self.collector = collector
+
+    def emit(self, record):
+        if "429" in record.getMessage():
+            self.collector.inc("numero_discord_rate_limited_total")
+
+
+collector = Collector()
+logging.getLogger("discord.http").addHandler(RateLimitHandler(collector))
@@ -0,0 +1,71 @@
+"""Lance le bot sur plusieurs processus, chacun avec une partie des shards.
+
+Ce processus ouvre la base (et la migre si besoin), puis sert d'écrivain unique : les
+processus du bot lui envoient leurs écritures au lieu de se disputer le verrou de
+game_stats.db, et lisent la base directement. Chaque processus reçoit ses shards
+(SHARD_COUNT / SHARD_IDS) et son port HTTP (PORT, à partir de --port).
+
+    python shards.py --processes 2 [--shards-per-process 1] [--port 8088]
+"""
+import argparse
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import time
+
+from database import Database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=2, help="nombre de processus du bot")
+    parser.add_argument("--shards-per-process", type=int, default=1, help="connexions à la passerelle par processus")
+    parser.add_argument("--port", type=int, default=8088, help="port HTTP du premier processus, les suivants prennent les ports suivants")
+    args = parser.parse_args()
+
+    shard_count = args.processes * args.shards_per_process
+    key = secrets.token_bytes(32)
+    db = Database(os.environ.get("GAME_STATS_DB", "game_stats.db"))
+    listener = db.serve(("127.0.0.1", 0), key)
+    host, port = listener.address
+
+    main_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    children = []
+    for index in range(args.processes):
+        shard_ids = range(index * args.shards_per_process, (index + 1) * args.shards_per_process)
+        env = dict(
+            os.environ,
+            SHARD_COUNT=str(shard_count),
+            SHARD_IDS=",".join(map(str, shard_ids)),
+            PORT=str(args.port + index),
+            GAME_STATS_WRITER=f"{host}:{port}",
+            GAME_STATS_WRITER_KEY=key.hex(),
+        )
+        children.append(subprocess.Popen([sys.executable, main_py], env=env))
+        print(f"🚀 Processus {index} : shards {list(shard_ids)} sur {shard_count}, port {args.port + index}")
+
+    def stop(signum, frame):
+        for child in children:
+            if child.poll() is None:
+                child.send_signal(signal.SIGINT)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    # Un processus qui s'arrête arrête les autres : le superviseur (systemd, Docker...) relance l'ensemble
+    while all(child.poll() is None for child in children):
+        time.sleep(1)
+    stop(None, None)
+    for child in children:
+        child.wait()
+
+    # L'écrivain ne s'arrête qu'après les processus du bot, qui vident leur file d'attente en quittant
+    listener.close()
+    db.close()
+    sys.exit(max(child.returncode for child in children))
+
+
+if __name__ == "__main__":
+    main()